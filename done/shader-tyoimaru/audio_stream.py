@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Audio-reactive parameter streamer for Shader-Tyoimaru
+WAVファイルまたは標準入力のPCMを窓付きFFTで解析し、帯域エネルギーを
+シェーダーパラメータに変換して、1本のWebSocket接続で一定のフレームレートで送信する
+
+使用例:
+    python audio_stream.py song.wav
+    arecord -f S16_LE -r 44100 -c 1 | python audio_stream.py - --rate 44100 --channels 1
+"""
+
+import asyncio
+import argparse
+import json
+import logging
+import sys
+import time
+import wave
+
+import numpy as np
+import websockets
+
+from param_schema import RANGES
+
+# ロギングの設定
+logging.basicConfig(
+    format="%(asctime)s %(message)s",
+    level=logging.INFO,
+)
+
+# デフォルト設定
+DEFAULT_SERVER = "localhost:8080"
+DEFAULT_FPS = 60
+DEFAULT_WINDOW = 2048
+
+# 解析する帯域 (Hz)
+BANDS = {
+    "low": (20, 250),
+    "mid": (250, 2000),
+    "high": (2000, 8000),
+}
+
+# パラメータ名 → 特徴量
+DEFAULT_FEATURES = {
+    "pulseAmplitude": "low",
+    "distortionAmount": "mid",
+    "edgePower": "high",
+    "baseHue": "centroid",
+}
+
+# パラメータ名 → (特徴量, 最小値, 最大値)  範囲はサーバーと同じ param_schema の定義から作る
+DEFAULT_MAPPING = {param: (feature, *RANGES[param]) for param, feature in DEFAULT_FEATURES.items()}
+
+
+class WavSource:
+    """WAVファイルからモノラルfloat32のサンプルを読み出す"""
+
+    def __init__(self, path):
+        self.wav = wave.open(path, "rb")
+        self.sample_rate = self.wav.getframerate()
+        self.channels = self.wav.getnchannels()
+        self.sample_width = self.wav.getsampwidth()
+        if self.sample_width not in (1, 2, 4):
+            raise ValueError(f"未対応のサンプル幅です: {self.sample_width * 8} bit")
+
+    def read(self, n):
+        raw = self.wav.readframes(n)
+        return pcm_to_mono(raw, self.sample_width, self.channels)
+
+    def close(self):
+        self.wav.close()
+
+
+class StdinSource:
+    """標準入力から signed 16bit little endian のPCMを読み出す"""
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.stream = sys.stdin.buffer
+
+    def read(self, n):
+        raw = self.stream.read(n * 2 * self.channels)
+        # フレームの途中で切れた分は捨てる
+        raw = raw[:len(raw) - len(raw) % (2 * self.channels)]
+        return pcm_to_mono(raw, 2, self.channels)
+
+    def close(self):
+        pass
+
+
+def pcm_to_mono(raw, sample_width, channels):
+    """PCMバイト列 → [-1, 1] のモノラルfloat32配列"""
+    if sample_width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    else:
+        x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    return x
+
+
+class BandAnalyzer:
+    """窓付きFFTで帯域エネルギーとスペクトル重心を求め、0〜1に正規化する"""
+
+    def __init__(self, sample_rate, window_size=DEFAULT_WINDOW, smoothing=0.6, peak_decay=0.995):
+        self.window = np.hanning(window_size).astype(np.float32)
+        self.buffer = np.zeros(window_size, dtype=np.float32)
+        self.smoothing = smoothing
+        self.peak_decay = peak_decay
+
+        freqs = np.fft.rfftfreq(window_size, 1.0 / sample_rate)
+        self.freqs = freqs.astype(np.float32)
+        # 各帯域のビン範囲 (周波数は昇順なのでスライスで足りる)
+        self.band_slices = {
+            name: slice(*np.searchsorted(freqs, [lo, hi]))
+            for name, (lo, hi) in BANDS.items()
+        }
+        self.peaks = {name: 1e-6 for name in BANDS}
+        self.features = dict.fromkeys(list(BANDS) + ["centroid"], 0.0)
+        self.log_min = np.log(BANDS["low"][0])
+        self.log_max = np.log(BANDS["high"][1])
+
+    def push(self, samples):
+        """新しいサンプルをリングバッファの末尾に追加する"""
+        n = len(samples)
+        if n >= len(self.buffer):
+            self.buffer[:] = samples[-len(self.buffer):]
+        elif n:
+            self.buffer[:-n] = self.buffer[n:]
+            self.buffer[-n:] = samples
+
+    def analyze(self):
+        """現在の窓を解析して特徴量 dict (0〜1) を返す"""
+        mag = np.abs(np.fft.rfft(self.buffer * self.window))
+        power = mag * mag
+
+        raw = {}
+        for name, sl in self.band_slices.items():
+            energy = float(power[sl].sum())
+            # 自動ゲイン: 減衰するピーク値で割る
+            self.peaks[name] = max(energy, self.peaks[name] * self.peak_decay)
+            raw[name] = energy / self.peaks[name]
+
+        total = float(mag.sum())
+        if total > 0:
+            centroid = float((self.freqs * mag).sum()) / total
+            centroid = np.log(max(centroid, BANDS["low"][0]))
+            raw["centroid"] = float(np.clip((centroid - self.log_min) / (self.log_max - self.log_min), 0, 1))
+        else:
+            raw["centroid"] = self.features["centroid"]
+
+        # 指数移動平均で平滑化
+        a = self.smoothing
+        for name, value in raw.items():
+            self.features[name] = a * self.features[name] + (1 - a) * value
+        return self.features
+
+
+def features_to_parameters(features, mapping=DEFAULT_MAPPING):
+    """特徴量 (0〜1) → シェーダーパラメータ"""
+    return {
+        param: round(lo + (hi - lo) * features[source], 4)
+        for param, (source, lo, hi) in mapping.items()
+    }
+
+
+class LatencyStats:
+    """フレームごとの解析時間と送信遅れの統計"""
+
+    def __init__(self):
+        self.analysis = []
+        self.lag = []
+        self.frames = 0
+        self.started = time.perf_counter()
+
+    def add(self, analysis_sec, lag_sec):
+        self.analysis.append(analysis_sec)
+        self.lag.append(lag_sec)
+        self.frames += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        out = {"frames": self.frames, "updates_per_sec": self.frames / elapsed if elapsed > 0 else 0.0}
+        for name, values in (("analysis_ms", self.analysis), ("lag_ms", self.lag)):
+            if values:
+                p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+                out[name] = {"p50": p50, "p95": p95, "p99": p99, "max": max(values) * 1000}
+        return out
+
+    def log(self):
+        s = self.summary()
+        parts = [f"{s['frames']} フレーム, {s['updates_per_sec']:.1f} 回/秒"]
+        for name in ("analysis_ms", "lag_ms"):
+            if name in s:
+                v = s[name]
+                parts.append(f"{name} p50={v['p50']:.2f} p95={v['p95']:.2f} p99={v['p99']:.2f} max={v['max']:.2f}")
+        logging.info(" | ".join(parts))
+
+
+async def stream(source, server_url, fps=DEFAULT_FPS, window_size=DEFAULT_WINDOW,
+                 smoothing=0.6, report_interval=5.0, dry_run=False):
+    """音声を解析しながら、一定のフレームレートでパラメータを送信し続ける"""
+    loop = asyncio.get_running_loop()
+    analyzer = BandAnalyzer(source.sample_rate, window_size, smoothing)
+    hop = max(1, round(source.sample_rate / fps))
+    stats = LatencyStats()
+    websocket = None
+
+    try:
+        t0 = time.perf_counter()
+        next_report = t0 + report_interval
+        frame = 0
+        while True:
+            # 標準入力の読み込みはブロックするので別スレッドで行う
+            samples = await loop.run_in_executor(None, source.read, hop)
+            if len(samples) == 0:
+                break
+
+            t_start = time.perf_counter()
+            analyzer.push(samples)
+            params = features_to_parameters(analyzer.analyze())
+            message = json.dumps(params)
+            t_analyzed = time.perf_counter()
+
+            # 予定時刻まで待つ (遅れている場合は待たずに送る)
+            deadline = t0 + frame / fps
+            if deadline > t_analyzed:
+                await asyncio.sleep(deadline - t_analyzed)
+
+            if not dry_run:
+                if websocket is None:
+                    websocket = await connect(server_url)
+                try:
+                    await websocket.send(message)
+                except websockets.exceptions.ConnectionClosed:
+                    logging.warning("接続が切れました。再接続します")
+                    websocket = None
+                    # このフレームの音声は読み終えているので、送れなくても時刻は進める
+                    frame += 1
+                    continue
+
+            stats.add(t_analyzed - t_start, max(0.0, time.perf_counter() - deadline))
+            frame += 1
+            if time.perf_counter() >= next_report:
+                stats.log()
+                next_report += report_interval
+    finally:
+        if websocket is not None:
+            await websocket.close()
+        source.close()
+    stats.log()
+    return stats.summary()
+
+
+async def drain(websocket):
+    """
+    サーバーからのメッセージ (自分の送ったパラメータのブロードキャストなど) を読み捨てる。
+    読まずに溜めると受信キューが詰まり、送信や切断処理が止まってしまう
+    """
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def connect(server_url, retry_interval=2.0):
+    """WebSocketサーバーに接続する (失敗したら再試行し続ける)"""
+    while True:
+        try:
+            websocket = await websockets.connect(f"ws://{server_url}")
+            logging.info(f"WebSocketサーバー {server_url} に接続しました")
+            asyncio.get_running_loop().create_task(drain(websocket))
+            return websocket
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            logging.warning(f"WebSocketサーバー {server_url} への接続に失敗: {e} ({retry_interval}秒後に再試行)")
+            await asyncio.sleep(retry_interval)
+
+
+def parse_arguments():
+    """コマンドライン引数の解析"""
+    parser = argparse.ArgumentParser(description="Shader-Tyoimaru Audio-reactive Streamer")
+    parser.add_argument("input", help="WAVファイル、または標準入力から読む場合は -")
+    parser.add_argument("--server", default=DEFAULT_SERVER,
+                        help=f"WebSocketサーバーのアドレス (デフォルト: {DEFAULT_SERVER})")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS,
+                        help=f"パラメータの送信レート (デフォルト: {DEFAULT_FPS})")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help=f"FFTの窓サイズ (デフォルト: {DEFAULT_WINDOW})")
+    parser.add_argument("--smoothing", type=float, default=0.6,
+                        help="平滑化係数 0〜1 (大きいほど滑らか, デフォルト: 0.6)")
+    parser.add_argument("--rate", type=int, default=44100,
+                        help="標準入力PCMのサンプルレート (デフォルト: 44100)")
+    parser.add_argument("--channels", type=int, default=1,
+                        help="標準入力PCMのチャンネル数 (デフォルト: 1)")
+    parser.add_argument("--report", type=float, default=5.0,
+                        help="統計を表示する間隔 (秒, デフォルト: 5)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="送信せずに解析と統計の表示だけ行う")
+    return parser.parse_args()
+
+
+def main():
+    """メイン関数"""
+    args = parse_arguments()
+    if args.input == "-":
+        source = StdinSource(args.rate, args.channels)
+    else:
+        source = WavSource(args.input)
+
+    print(f"🎵 {args.input} ({source.sample_rate} Hz) を解析して {args.fps:g} 回/秒で送信します")
+    try:
+        asyncio.run(stream(source, args.server, args.fps, args.window, args.smoothing,
+                           args.report, args.dry_run))
+    except KeyboardInterrupt:
+        logging.info("終了します")
+
+
+if __name__ == "__main__":
+    main()
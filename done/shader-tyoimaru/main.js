@@ -58,6 +58,21 @@ let paramsDebugTimer;  // パラメータデバッグ表示タイマー
 let ws;                // WebSocketオブジェクト
 let wsConnected = false; // WebSocket接続状態
 let wsLastMessage = ""; // 最後に受信したメッセージ
+let wsParamNames = {};  // バイナリ形式のパラメータ id → [名前, 型] (サーバーの hello で受け取る)
+
+// バイナリフレームの種類 (param_schema.py と同じ値)
+const FRAME_PARAMS = 1;
+
+// サーバーのアニメーション (キーフレーム) の補間
+let paramAnimations = {}; // パラメータ名 → {from, to, start, duration, easing}
+
+// イージング関数 (ws_animation.py の EASINGS と同じ式)
+const EASINGS = {
+  linear: x => x,
+  easeInOutSine: x => -(Math.cos(Math.PI * x) - 1) / 2,
+  easeInOutQuad: x => x < 0.5 ? 2 * x * x : 1 - Math.pow(-2 * x + 2, 2) / 2,
+  easeInOutCubic: x => x < 0.5 ? 4 * x * x * x : 1 - Math.pow(-2 * x + 2, 3) / 2
+};
 
 // シェーダーパラメータ
 let shaderParams = {
@@ -139,23 +154,50 @@ function initWebSocket() {
   try {
     // WebSocketオブジェクトの作成
     ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
     
     // 接続イベントのハンドラ
     ws.onopen = function(event) {
       console.log("WebSocket接続が確立されました");
       wsConnected = true;
       updateWsStatus("接続済み", "green");
+      
+      // バイナリ形式に対応していることをサーバーに伝える
+      // (hello を送らない古いクライアントにはJSONのまま送られる)
+      ws.send(JSON.stringify({ type: "hello", formats: ["binary", "json"] }));
     };
     
     // メッセージ受信イベントのハンドラ
     ws.onmessage = function(event) {
+      updateWsStatus("データ受信", "green");
+      
+      // バイナリフレームはパラメータの差分
+      if (event.data instanceof ArrayBuffer) {
+        const data = decodeParamFrame(event.data);
+        wsLastMessage = JSON.stringify(data);
+        updateShaderParams(data);
+        return;
+      }
+      
       console.log("WebSocketメッセージを受信:", event.data);
       wsLastMessage = event.data;
-      updateWsStatus("データ受信", "green");
       
       // 受信したJSONデータを解析
       try {
         const data = JSON.parse(event.data);
+        if (data.type === "keyframe") {
+          startParamAnimations(data.params);
+          return;
+        }
+        if (data.type === "hello") {
+          // 送信形式とパラメータの定義を受け取る
+          wsParamNames = {};
+          for (const p of data.schema) {
+            wsParamNames[p.id] = [p.name, p.type];
+          }
+          console.log(`送信形式: ${data.format}`);
+          return;
+        }
         updateShaderParams(data);
       } catch (e) {
         console.error("JSONデータの解析に失敗:", e);
@@ -185,6 +227,27 @@ function initWebSocket() {
   }
 }
 
+/**
+ * パラメータのバイナリフレームを解析
+ * 先頭 1 バイトが FRAME_PARAMS で、その後に (id uint8, 値 float32 little endian) が並ぶ
+ * @param {ArrayBuffer} buffer - 受信したフレーム
+ * @returns {Object} パラメータ名 → 値
+ */
+function decodeParamFrame(buffer) {
+  const view = new DataView(buffer);
+  const data = {};
+  if (view.byteLength === 0 || view.getUint8(0) !== FRAME_PARAMS) return data;
+  
+  for (let offset = 1; offset + 5 <= view.byteLength; offset += 5) {
+    const param = wsParamNames[view.getUint8(offset)];
+    if (!param) continue;
+    const value = view.getFloat32(offset + 1, true);
+    const [name, type] = param;
+    data[name] = type === "bool" ? value !== 0 : type === "int" ? Math.round(value) : value;
+  }
+  return data;
+}
+
 /**
  * WebSocket状態表示の更新
  * @param {string} status - 状態テキスト
@@ -365,6 +428,11 @@ function updateShaderParams(data) {
   // 変更されたパラメータを追跡
   const changedParams = {};
   
+  // 直接設定された値はアニメーションより優先する
+  for (const key of Object.keys(data)) {
+    delete paramAnimations[key];
+  }
+  
   // 頂点シェーダーパラメータの更新
   if (data.timeScale !== undefined) {
     changedParams.timeScale = data.timeScale;
@@ -436,6 +504,45 @@ function updateShaderParams(data) {
   showParamsDebug(changedParams);
 }
 
+/**
+ * キーフレームを受け取り、パラメータのアニメーションを開始する
+ * @param {Object} params - パラメータ名 → {from, to, duration, elapsed, easing} (時間はミリ秒)
+ */
+function startParamAnimations(params) {
+  const now = performance.now();
+  for (const [name, kf] of Object.entries(params)) {
+    paramAnimations[name] = {
+      from: kf.from,
+      to: kf.to,
+      start: now - (kf.elapsed || 0),
+      duration: kf.duration,
+      easing: EASINGS[kf.easing] || EASINGS.linear
+    };
+  }
+}
+
+/**
+ * アニメーション中のパラメータを現在時刻の値に更新（毎フレーム呼ぶ）
+ */
+function updateParamAnimations() {
+  const now = performance.now();
+  for (const [name, anim] of Object.entries(paramAnimations)) {
+    const x = anim.duration > 0 ? Math.min(1, (now - anim.start) / anim.duration) : 1;
+    const value = anim.from + (anim.to - anim.from) * anim.easing(x);
+    
+    if (name in shaderParams) {
+      shaderParams[name] = value;
+    } else if (name === 'rotationSpeed') {
+      rotationSpeed = value;
+    }
+    
+    // 区間の終わりに達したら次のキーフレームまで目標値で止める
+    if (x >= 1) {
+      delete paramAnimations[name];
+    }
+  }
+}
+
 /**
  * パラメータデバッグ表示の更新
  * @param {Object} params - 表示するパラメータ
@@ -748,6 +855,9 @@ function draw() {
   // 経過時間の計算（秒単位）
   let elapsedTime = (millis() - startTime) / 1000.0;
   
+  // サーバーから受け取ったアニメーションを補間
+  updateParamAnimations();
+  
   // シェーダーのユニフォーム変数を更新
   updateShaderUniforms(elapsedTime);
   
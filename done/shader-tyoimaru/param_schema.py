@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shader-Tyoimaru のパラメータ定義 (サーバー・クライアント共通)
+
+各パラメータの id (バイナリ形式で使う 1 バイトの番号)、型、推奨範囲、説明をここにまとめる。
+サーバーの更新判定とランダム生成、ws_client.py のコマンドライン引数はすべてこの表から作る。
+
+バイナリフレーム (little endian):
+    FRAME_PARAMS (uint8) の後に (id uint8, value float32) の組を並べる
+    JSON では 1 パラメータあたり 20〜30 バイトだが、バイナリでは 5 バイト
+"""
+
+import struct
+
+# (id, 名前, 型, 最小値, 最大値, 説明)  id は変更しないこと (バイナリ形式の互換性のため)
+PARAMETERS = (
+    # 頂点シェーダーパラメータ
+    (1, "timeScale", "float", 0.05, 0.3, "時間変化の速度"),
+    (2, "distortionAmount", "float", 0.2, 0.8, "歪みの強さ"),
+    (3, "secondaryWaveAmplitude", "float", 0.05, 0.3, "二次的な波の振幅"),
+    (4, "bumpStrength", "float", 0.1, 0.4, "膨らみの強さ"),
+
+    # フラグメントシェーダーパラメータ
+    (5, "baseHue", "float", 0.0, 1.0, "基本色相"),
+    (6, "hueVariation", "float", 0.1, 0.5, "色相の変化量"),
+    (7, "hueTimeFactor", "float", 0.05, 0.2, "色相の時間変化量"),
+    (8, "timeSpeed", "float", 0.1, 0.4, "ノイズの時間変化速度"),
+    (9, "edgePower", "float", 1.0, 4.0, "エッジ強調の強さ"),
+    (10, "pulseAmplitude", "float", 0.02, 0.1, "脈動の強さ"),
+    (11, "pulseSpeed", "float", 1.0, 4.0, "脈動の速度"),
+
+    # その他のパラメータ
+    (12, "rotationSpeed", "float", 0.01, 0.1, "回転速度"),
+    (13, "autoRotate", "bool", 0, 1, "自動回転のON/OFF"),
+    (14, "sphereDetail", "int", 12, 1024, "球体の詳細度"),
+)
+
+PARAMETER_KEYS = tuple(p[1] for p in PARAMETERS)
+PARAMETER_NAMES = frozenset(PARAMETER_KEYS)
+NAME_TO_ID = {p[1]: p[0] for p in PARAMETERS}
+ID_TO_NAME = {p[0]: p[1] for p in PARAMETERS}
+TYPES = {p[1]: p[2] for p in PARAMETERS}
+RANGES = {p[1]: (p[3], p[4]) for p in PARAMETERS}
+
+# バイナリフレームの種類 (先頭 1 バイト)
+FRAME_PARAMS = 1
+
+_PAIR = struct.Struct("<Bf")
+_CONVERT = {"float": float, "int": int, "bool": bool}
+
+
+def coerce(name, value):
+    """値をスキーマの型に変換する (変換できなければ ValueError)"""
+    if value is None:
+        raise ValueError(f"{name} の値がありません")
+    if TYPES[name] == "bool" and isinstance(value, str):
+        return value.lower() == "true"
+    if isinstance(value, bool) and TYPES[name] != "bool":
+        raise ValueError(f"{name} に真偽値は使えません")
+    return _CONVERT[TYPES[name]](value)
+
+
+def parse_parameters(data):
+    """
+    dict からパラメータのキーだけを取り出し、型をそろえて返す。
+    型が合わない値は捨てる
+    """
+    params = {}
+    for key in PARAMETER_KEYS:
+        if key not in data:
+            continue
+        try:
+            params[key] = coerce(key, data[key])
+        except (TypeError, ValueError):
+            pass
+    return params
+
+
+def encode_binary(params):
+    """パラメータ dict → バイナリフレーム。パラメータ以外のキーを含むなら None"""
+    if not PARAMETER_NAMES.issuperset(params):
+        return None
+    frame = bytearray((FRAME_PARAMS,))
+    for key, value in params.items():
+        frame += _PAIR.pack(NAME_TO_ID[key], float(value))
+    return bytes(frame)
+
+
+def decode_binary(frame):
+    """バイナリフレーム → パラメータ dict (知らない id は飛ばす)"""
+    if not frame or frame[0] != FRAME_PARAMS or (len(frame) - 1) % _PAIR.size:
+        raise ValueError("パラメータのバイナリフレームではありません")
+    params = {}
+    for pid, value in _PAIR.iter_unpack(frame[1:]):
+        name = ID_TO_NAME.get(pid)
+        if name is not None:
+            params[name] = coerce(name, value)
+    return params
+
+
+def schema_for_client():
+    """ブラウザに渡すスキーマ (id, 名前, 型)"""
+    return [{"id": pid, "name": name, "type": kind} for pid, name, kind, *_ in PARAMETERS]
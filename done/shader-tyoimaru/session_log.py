@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+セッションログ (パラメータの更新とアニメーションの指示の記録と再生)
+
+ログファイル (little endian, 追記のみ):
+    ヘッダー  b"SLOG", version uint16, 予約 uint16, 開始時刻 float64 (time.time())
+    レコード  時刻 float64, 種類 uint8, 長さ uint32, 内容 (UTF-8 JSON) の繰り返し
+
+インデックスファイル (<ログ>.idx):
+    (時刻 float64, レコードのオフセット uint64, レコード番号 uint64) の繰り返し
+    INDEX_INTERVAL 秒ごとに、その時点の全パラメータとアニメーションのスナップショットを
+    レコードとして書き、その位置をインデックスに追加する。
+    途中から再生するときは、インデックスを二分探索してスナップショットから読み始めるので、
+    先頭から読み直す必要がない。
+
+書き込みは専用のスレッドで行い、イベントループはキューに積むだけ。
+
+    python session_log.py info session.slog
+"""
+
+import argparse
+import bisect
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+MAGIC = b"SLOG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHd")
+RECORD = struct.Struct("<dBI")
+INDEX_ENTRY = struct.Struct("<dQQ")
+
+# レコードの種類
+KIND_PARAMS = 1    # パラメータの更新 (dict)
+KIND_ANIMATE = 2   # アニメーションの指示 (dict)
+KIND_SNAPSHOT = 3  # {"params": 全パラメータ, "animations": パラメータ名 → 最後の指示}
+
+INDEX_INTERVAL = 1.0  # 秒
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class SessionRecorder:
+    """
+    レコードを別スレッドで追記する。record() はキューに積むだけなのでイベントループを止めない。
+    スレッドは自分でパラメータの状態を追いかけ、INDEX_INTERVAL ごとにスナップショットを書く
+    """
+
+    def __init__(self, path, initial_params, index_interval=INDEX_INTERVAL, flush_interval=0.5):
+        self.path = path
+        self.index_interval = index_interval
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.params = dict(initial_params)
+        self.animations = {}
+        self.count = 0
+        self.started = time.time()
+
+        self.fp = open(path, "wb")
+        self.fp.write(HEADER.pack(MAGIC, VERSION, 0, self.started))
+        self.index = open(index_path(path), "wb")
+        self.thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, data):
+        """イベントループから呼ぶ (時刻はここで取る)"""
+        self.queue.put((time.time(), kind, data))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _track(self, kind, data):
+        if kind == KIND_PARAMS:
+            self.params.update(data)
+            # 直接設定された値はアニメーションを止める (ws_server.py と同じ規則)
+            for key in data:
+                self.animations.pop(key, None)
+        elif kind == KIND_ANIMATE:
+            if data.get("kind") == "stop":
+                if data.get("param") == "*":
+                    self.animations.clear()
+                else:
+                    self.animations.pop(data.get("param"), None)
+            else:
+                self.animations[data["param"]] = data
+
+    def _write(self, t, kind, data):
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        self.fp.write(RECORD.pack(t, kind, len(payload)))
+        self.fp.write(payload)
+        self.count += 1
+
+    def _snapshot(self, t):
+        self.index.write(INDEX_ENTRY.pack(t, self.fp.tell(), self.count))
+        self._write(t, KIND_SNAPSHOT, {"params": self.params, "animations": self.animations})
+
+    def _run(self):
+        self._snapshot(self.started)
+        next_index = self.started + self.index_interval
+        next_flush = time.time() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                t, kind, data = item
+                if t >= next_index:
+                    self._snapshot(t)
+                    next_index = t + self.index_interval
+                self._write(t, kind, data)
+                self._track(kind, data)
+            if time.time() >= next_flush:
+                self.fp.flush()
+                self.index.flush()
+                next_flush = time.time() + self.flush_interval
+        self.fp.close()
+        self.index.close()
+
+
+class SessionReader:
+    """ログの読み出し。seek() はインデックスを二分探索してスナップショットの位置から読む"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, "rb")
+        magic, version, _, self.started = HEADER.unpack(self.fp.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} はセッションログではありません")
+        if version != VERSION:
+            raise ValueError(f"未対応のセッションログのバージョンです: {version}")
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), "rb") as fp:
+                raw = fp.read()
+        except FileNotFoundError:
+            return [(self.started, HEADER.size, 0)]
+        # 書き込み途中で終わった最後のエントリは捨てる
+        raw = raw[:len(raw) - len(raw) % INDEX_ENTRY.size]
+        return list(INDEX_ENTRY.iter_unpack(raw)) or [(self.started, HEADER.size, 0)]
+
+    def seek(self, offset_sec):
+        """
+        開始から offset_sec 秒の位置の直前のスナップショットに移動し、その時刻を返す。
+        この後の read() は最初にそのスナップショットを返す
+        """
+        times = [entry[0] for entry in self.index]
+        i = max(0, bisect.bisect_right(times, self.started + offset_sec) - 1)
+        self.fp.seek(self.index[i][1])
+        return self.index[i][0]
+
+    def read(self):
+        """(時刻, 種類, dict) を1つ返す。終わり (または書き込み途中のレコード) なら None"""
+        head = self.fp.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return None
+        t, kind, length = RECORD.unpack(head)
+        payload = self.fp.read(length)
+        if len(payload) < length:
+            return None
+        return t, kind, json.loads(payload)
+
+    def read_batch(self, n=256):
+        batch = []
+        for _ in range(n):
+            record = self.read()
+            if record is None:
+                break
+            batch.append(record)
+        return batch
+
+    def info(self):
+        last_t, _, last_count = self.index[-1]
+        size = os.path.getsize(self.path)
+        return {
+            "started": self.started,
+            "indexed_seconds": last_t - self.started,
+            "indexed_records": last_count,
+            "index_entries": len(self.index),
+            "bytes": size,
+        }
+
+    def close(self):
+        self.fp.close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Shader-Tyoimaru セッションログ")
+    parser.add_argument("command", choices=["info"], help="info: ログの長さとレコード数を表示")
+    parser.add_argument("path", help="セッションログ")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    reader = SessionReader(args.path)
+    info = reader.info()
+    print(f"開始: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['started']))}")
+    print(f"長さ: 約 {info['indexed_seconds']:.1f} 秒 (最後のインデックスまで)")
+    print(f"レコード: {info['indexed_records']} 件以上, インデックス {info['index_entries']} 件, {info['bytes']} バイト")
+    reader.close()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ws_server.py のテスト (python -m pytest test_ws_server.py)
+"""
+
+import asyncio
+import json
+import time
+
+# websockets.serve を呼ばないテストでは exceptions が読み込まれないので明示する
+import websockets.exceptions  # noqa: F401
+
+import ws_server
+from ws_animation import AnimationEngine, validate_command
+
+
+class FakeWebSocket:
+    """送信したフレームを記録するだけの WebSocket"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def test_late_joiner_gets_snapshot_before_keyframes():
+    """アニメーション中に接続したクライアントには、スナップショットの後にキーフレームが届く"""
+    async def run():
+        ws_server.engine = AnimationEngine(ws_server.send_keyframes)
+        command = validate_command({"type": "animate", "kind": "tween", "param": "baseHue",
+                                    "to": 0.9, "duration": 5})
+        start = time.time()
+        ws_server.engine.command(dict(command, start=start), ws_server.state.values)
+        # engine.run() と同じく区間を開始させる
+        ws_server.engine.advance(start, ws_server.state.values)
+
+        websocket = FakeWebSocket()
+        await ws_server.register(websocket)
+        client = ws_server.clients[websocket]
+        for _ in range(100):
+            if not client.backlog():
+                break
+            await asyncio.sleep(0.01)
+        await ws_server.unregister(websocket)
+        return [json.loads(frame) for frame in websocket.sent]
+
+    messages = asyncio.run(run())
+    assert len(messages) == 2
+    snapshot, keyframes = messages
+    assert "type" not in snapshot and "baseHue" in snapshot
+    assert keyframes["type"] == "keyframe"
+    assert keyframes["params"]["baseHue"]["to"] == 0.9
+
+
+def test_parameters_that_fail_coercion_are_invalid():
+    """型が合う値が1つもないパラメータ更新は、反映も送信もせず invalid として数える"""
+    def count(kind):
+        return ws_server.messages_received.values.get((("type", kind),), 0)
+
+    async def run(message):
+        await ws_server.dispatch_message(FakeWebSocket(), json.dumps(message))
+
+    ws_server.state.take_delta()
+    before = count("param"), count("invalid")
+    asyncio.run(run({"sphereDetail": "abc"}))
+    assert (count("param"), count("invalid")) == (before[0], before[1] + 1)
+    assert ws_server.state.take_delta() == {}
+
+    asyncio.run(run({"sphereDetail": 64, "baseHue": "abc"}))
+    assert count("param") == before[0] + 1
+    assert ws_server.state.take_delta() == {"sphereDetail": 64}
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ws_server.py のパラメータアニメーション
+
+サーバーはフレームごとの値を送らず、区間の始まりにキーフレーム (目標値・長さ・イージング) を
+1回だけ送る。ブラウザはそれを受け取って毎フレーム補間するので、サーバーの CPU と通信量は
+フレームレートではなくキーフレームの数に比例する。
+
+アニメーションの指示 (コントローラーから):
+    {"type": "animate", "param": "baseHue", "kind": "tween", "to": 0.3, "duration": 2.0, "easing": "easeInOutSine"}
+    {"type": "animate", "param": "baseHue", "kind": "lfo", "period": 4.0, "min": 0.2, "max": 0.8}
+    {"type": "animate", "param": "baseHue", "kind": "walk", "interval": 1.5, "step": 0.2}
+    {"type": "animate", "param": "baseHue", "kind": "stop"}       ("param": "*" ならすべて)
+
+時間は秒、min / max を省略するとパラメータの範囲 (param_schema.py) を使う。
+区間の予定は指示に付けた開始時刻 (time.time()) と乱数の種だけで決まるので、
+複数ワーカーでも同じ指示を受け取れば同じキーフレームになる。
+
+キーフレーム (サーバー → ブラウザ):
+    {"type": "keyframe", "params": {"baseHue": {"from": 0.7, "to": 0.3, "duration": 2000,
+                                                "elapsed": 0, "easing": "easeInOutSine"}}}
+"""
+
+import asyncio
+import math
+import random
+import time
+
+from param_schema import RANGES, TYPES
+
+# main.js の EASINGS と同じ式
+EASINGS = {
+    "linear": lambda x: x,
+    "easeInOutSine": lambda x: -(math.cos(math.pi * x) - 1) / 2,
+    "easeInOutQuad": lambda x: 2 * x * x if x < 0.5 else 1 - (-2 * x + 2) ** 2 / 2,
+    "easeInOutCubic": lambda x: 4 * x ** 3 if x < 0.5 else 1 - (-2 * x + 2) ** 3 / 2,
+}
+KINDS = ("tween", "lfo", "walk", "stop")
+
+
+class Segment:
+    """1つのキーフレーム区間 (start から duration 秒で from_value → to)"""
+
+    def __init__(self, start, duration, from_value, to, easing):
+        self.start = start
+        self.duration = duration
+        self.from_value = from_value
+        self.to = to
+        self.easing = easing
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def value_at(self, t):
+        if self.duration <= 0 or t >= self.end:
+            return self.to
+        x = max(0.0, (t - self.start) / self.duration)
+        return self.from_value + (self.to - self.from_value) * EASINGS[self.easing](x)
+
+    def to_message(self, now):
+        return {
+            "from": self.from_value,
+            "to": self.to,
+            "duration": round(self.duration * 1000),
+            "elapsed": round(max(0.0, now - self.start) * 1000),
+            "easing": self.easing,
+        }
+
+
+# 種類ごとの数値の項目 (必須, 省略時の値)
+FIELDS = {
+    "tween": {"to": (True, None), "duration": (False, 1.0)},
+    "lfo": {"period": (False, 4.0)},
+    "walk": {"interval": (False, 2.0), "step": (False, 0.25)},
+}
+POSITIVE = ("duration", "period", "interval", "step")
+
+
+def _number(command, key):
+    value = command[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{key} は有限の数にしてください: {value!r}")
+    return float(value)
+
+
+def validate_command(command):
+    """
+    指示を検証し、そのまま timeline() に渡せる形にそろえた dict を返す (不正なら ValueError)。
+    数値の項目は有限の数であることを確かめ、to / min / max はパラメータの範囲に収める。
+    リレーで全ワーカーに配る前に呼ぶこと (ワーカー側で例外にならないように)
+    """
+    kind = command.get("kind")
+    if kind not in KINDS:
+        raise ValueError(f"未対応のアニメーションです: {kind}")
+    param = command.get("param")
+    if kind == "stop" and param == "*":
+        return dict(command)
+    if not isinstance(param, str) or TYPES.get(param) != "float":
+        raise ValueError(f"アニメーションできないパラメータです: {param}")
+    command = dict(command)
+    if kind == "stop":
+        return command
+
+    easing = command.setdefault("easing", "easeInOutSine")
+    if not isinstance(easing, str) or easing not in EASINGS:
+        raise ValueError(f"未対応のイージングです: {easing}")
+
+    lo, hi = RANGES[param]
+    for key, (required, default) in FIELDS[kind].items():
+        if key not in command:
+            if required:
+                raise ValueError(f"{kind} には {key} が必要です")
+            command[key] = default
+        command[key] = _number(command, key)
+        if key in POSITIVE and not command[key] > 0:
+            raise ValueError(f"{key} は正の数にしてください")
+    if "to" in command:
+        command["to"] = min(hi, max(lo, command["to"]))
+
+    for key, default in (("min", lo), ("max", hi)):
+        command[key] = min(hi, max(lo, _number(command, key))) if key in command else float(default)
+    if command["min"] > command["max"]:
+        raise ValueError("min は max 以下にしてください")
+    return command
+
+
+def timeline(command, from_value):
+    """指示 → 区間の予定 (start, duration, to, easing) を順に返すジェネレーター"""
+    param = command["param"]
+    lo, hi = RANGES[param]
+    lo = float(command.get("min", lo))
+    hi = float(command.get("max", hi))
+    start = float(command["start"])
+    easing = command.get("easing", "easeInOutSine")
+    kind = command["kind"]
+
+    if kind == "tween":
+        yield start, float(command.get("duration", 1.0)), float(command["to"]), easing
+
+    elif kind == "lfo":
+        # 半周期ごとに最大値と最小値を行き来する (easeInOutSine なら正弦波になる)
+        half = float(command.get("period", 4.0)) / 2
+        k = 0
+        while True:
+            yield start + k * half, half, hi if k % 2 == 0 else lo, easing
+            k += 1
+
+    elif kind == "walk":
+        # 範囲の step 倍までの歩幅でランダムに目標値を選び、interval 秒かけて移動する
+        rng = random.Random(command["seed"])
+        interval = float(command.get("interval", 2.0))
+        step = float(command.get("step", 0.25)) * (hi - lo)
+        value = from_value
+        k = 0
+        while True:
+            value = min(hi, max(lo, value + rng.uniform(-step, step)))
+            yield start + k * interval, interval, value, easing
+            k += 1
+
+
+class AnimationEngine:
+    """
+    パラメータごとのタイムラインを動かし、区間が始まるたびに on_keyframes(dict) を呼ぶ
+    (dict はパラメータ名 → Segment)
+    """
+
+    def __init__(self, on_keyframes):
+        self.on_keyframes = on_keyframes
+        self.timelines = {}  # パラメータ名 → (区間のジェネレーター, 次の区間)
+        self.segments = {}   # パラメータ名 → 現在 (または最後) の Segment
+        self.pending = {}    # まだ送っていない新しい区間
+        self.wakeup = asyncio.Event()
+
+    def command(self, command, default_values):
+        """
+        指示を反映する。始点は指示の開始時刻での値にする (それまでの区間を先に進めておくので、
+        ワーカーごとの処理のタイミングによらず同じ値になる)
+        """
+        param = command["param"]
+        start = float(command["start"])
+        self.pending.update(self.advance(start, default_values))
+        self.wakeup.set()
+        if command["kind"] == "stop":
+            self.stop(None if param == "*" else [param])
+            return
+        current_value = self.value_at(param, start, default_values.get(param, RANGES[param][0]))
+        gen = timeline(command, current_value)
+        self.timelines[param] = (gen, next(gen))
+
+    def stop(self, params=None):
+        """タイムラインを止める (params が None ならすべて)。進行中の区間はブラウザ側で最後まで補間される"""
+        for param in list(self.timelines if params is None else params):
+            self.timelines.pop(param, None)
+
+    def release(self, params):
+        """値が直接設定されたパラメータのタイムラインと進行中の区間を捨て、アニメーション中だったものを返す"""
+        released = []
+        for param in params:
+            if param in self.timelines or param in self.segments:
+                released.append(param)
+            self.timelines.pop(param, None)
+            self.segments.pop(param, None)
+            self.pending.pop(param, None)
+        return released
+
+    def value_at(self, param, t, default):
+        segment = self.segments.get(param)
+        return default if segment is None else segment.value_at(t)
+
+    def current_values(self, now):
+        """進行中の区間の現在値 (新しく接続したクライアントへのスナップショット用)"""
+        return {param: seg.value_at(now) for param, seg in self.segments.items() if seg.end > now}
+
+    def active_keyframes(self, now):
+        """進行中の区間のキーフレーム (途中から補間を続けるためのもの)"""
+        return {param: seg for param, seg in self.segments.items() if seg.end > now}
+
+    def advance(self, now, default_values):
+        """
+        開始時刻を過ぎた区間を進め、新しく始まった区間を返す。
+        遅れて追いついた場合は、途中の区間を飛ばして最新の区間だけを返す
+        """
+        started = {}
+        for param, (gen, upcoming) in list(self.timelines.items()):
+            while upcoming is not None and upcoming[0] <= now:
+                start, duration, to, easing = upcoming
+                from_value = self.value_at(param, start, default_values.get(param, to))
+                self.segments[param] = started[param] = Segment(start, duration, from_value, to, easing)
+                upcoming = next(gen, None)
+            if upcoming is None:
+                del self.timelines[param]
+            else:
+                self.timelines[param] = (gen, upcoming)
+        return started
+
+    def next_start(self):
+        starts = [upcoming[0] for _, upcoming in self.timelines.values()]
+        return min(starts) if starts else None
+
+    async def run(self, default_values):
+        """
+        区間の開始時刻ごとに起きてキーフレームを送る。
+        default_values() は区間の始点に使う現在のパラメータ値 (dict) を返す
+        """
+        while True:
+            started, self.pending = self.pending, {}
+            started.update(self.advance(time.time(), default_values()))
+            if started:
+                self.on_keyframes(started)
+            self.wakeup.clear()
+            t = self.next_start()
+            timeout = None if t is None else max(0.0, t - time.time())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Load test / latency benchmark for the Shader-Tyoimaru WebSocket server
+ws_server.py をローカルで起動し、N 個の表示クライアントと M 個のコントローラーを接続して
+ファンアウト遅延 (p50/p95/p99)、受信メッセージ数/秒、サーバーの CPU とメモリを計測する。
+結果は JSON ファイルに保存するので、実行ごとに比較できる。
+
+使用例:
+    python ws_bench.py --displays 1000 --controllers 2 --rate 200 --duration 10
+    python ws_bench.py --displays 3000 --procs 4 --output after.json --compare before.json
+    python ws_bench.py --displays 1000 -- --workers 4     (-- より後ろは ws_server.py の引数)
+"""
+
+import asyncio
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import websockets
+
+# ロギングの設定
+logging.basicConfig(
+    format="%(asctime)s %(message)s",
+    level=logging.INFO,
+)
+
+DEFAULT_PORT = 8090
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ws_server.py")
+
+# コントローラーが送信時刻 (time.time()) を値として書き込むパラメータ。
+# サーバーはパラメータのキーしか転送しないので、実在するキーを使う
+TIMESTAMP_KEYS = ("timeScale", "distortionAmount", "secondaryWaveAmplitude", "bumpStrength",
+                  "baseHue", "hueVariation", "hueTimeFactor", "timeSpeed")
+# 初期値などのタイムスタンプでない値と区別するためのしきい値
+MIN_TIMESTAMP = 1e9
+
+
+def percentiles(values):
+    """p50 / p95 / p99 / max (ミリ秒)"""
+    if not values:
+        return None
+    values = sorted(values)
+    n = len(values)
+
+    def pick(q):
+        return values[min(n - 1, int(q * n))] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": values[-1] * 1000, "count": n}
+
+
+def raise_fd_limit():
+    """数千の接続を開けるようにファイルディスクリプタの上限を引き上げる"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+#-----------------------------------------------------------------------------
+# 表示クライアント (別プロセス)
+#-----------------------------------------------------------------------------
+def display_worker(url, count, stop_event, results, connect_concurrency):
+    raise_fd_limit()
+    asyncio.run(run_displays(url, count, stop_event, results, connect_concurrency))
+
+
+async def run_displays(url, count, stop_event, results, connect_concurrency):
+    latencies = []
+    received = 0
+    sem = asyncio.Semaphore(connect_concurrency)
+
+    async def open_one():
+        async with sem:
+            return await websockets.connect(url, open_timeout=30)
+
+    conns = await asyncio.gather(*(open_one() for _ in range(count)), return_exceptions=True)
+    ok = [c for c in conns if not isinstance(c, BaseException)]
+    results.put(("ready", len(ok), len(conns) - len(ok)))
+
+    async def reader(ws):
+        nonlocal received
+        try:
+            async for message in ws:
+                now = time.time()
+                received += 1
+                data = json.loads(message)
+                for key in TIMESTAMP_KEYS:
+                    sent_at = data.get(key)
+                    if isinstance(sent_at, (int, float)) and sent_at > MIN_TIMESTAMP:
+                        latencies.append(now - sent_at)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    readers = [asyncio.create_task(reader(ws)) for ws in ok]
+    t0 = time.time()
+    await asyncio.get_running_loop().run_in_executor(None, stop_event.wait)
+    elapsed = time.time() - t0
+    results.put(("result", {"received": received, "latencies": latencies, "seconds": elapsed,
+                            "closed_early": sum(1 for r in readers if r.done())}))
+    for r in readers:
+        r.cancel()
+
+
+#-----------------------------------------------------------------------------
+# コントローラー (メインプロセス)
+#-----------------------------------------------------------------------------
+async def run_controller(url, index, rate, duration, test_interval):
+    """rate 件/秒で送信時刻入りのパラメータを送り、test メッセージの往復遅延を測る"""
+    key = TIMESTAMP_KEYS[index % len(TIMESTAMP_KEYS)]
+    rtts = []
+    pending = {}
+    sent = 0
+    ws = await websockets.connect(url)
+
+    async def reader():
+        try:
+            async for message in ws:
+                if '"response"' not in message:
+                    continue
+                data = json.loads(message)
+                sent_at = pending.pop(data.get("received", {}).get("id"), None)
+                if sent_at is not None:
+                    rtts.append(time.time() - sent_at)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    reader_task = asyncio.create_task(reader())
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    next_send = start
+    next_test = start
+    test_id = 0
+    while time.perf_counter() - start < duration:
+        now = time.perf_counter()
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+        next_send += interval
+        await ws.send(json.dumps({key: time.time()}))
+        sent += 1
+        if time.perf_counter() >= next_test:
+            test_id += 1
+            pending[test_id] = time.time()
+            await ws.send(json.dumps({"type": "test", "id": test_id}))
+            next_test += test_interval
+    await asyncio.sleep(0.5)
+    reader_task.cancel()
+    await ws.close()
+    return {"sent": sent, "rtts": rtts}
+
+
+#-----------------------------------------------------------------------------
+# サーバーの CPU / メモリ (Linux の /proc から読む)
+#-----------------------------------------------------------------------------
+def child_pids(pid):
+    """pid の子孫プロセス (--workers のワーカーなど)"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as fp:
+                    parents.setdefault(int(fp.read().rsplit(")", 1)[1].split()[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    found, stack = [], [pid]
+    while stack:
+        children = parents.get(stack.pop(), [])
+        found += children
+        stack += children
+    return found
+
+
+def read_proc_stats(pid):
+    """サーバーとその子プロセスの合計 (CPU 秒, RSS MB)。/proc がなければ None"""
+    cpu = rss_kb = 0
+    try:
+        pids = [pid] + child_pids(pid)
+    except OSError:
+        return None
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/stat") as fp:
+                fields = fp.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{p}/status") as fp:
+                rss_kb += next(int(line.split()[1]) for line in fp if line.startswith("VmRSS:"))
+        except (OSError, StopIteration, IndexError, ValueError):
+            if p == pid:
+                return None
+    return cpu, rss_kb / 1024
+
+
+async def sample_server(pid, stop, interval=0.5):
+    samples = []
+    while not stop.is_set():
+        s = read_proc_stats(pid)
+        if s:
+            samples.append((time.time(), *s))
+        await asyncio.sleep(interval)
+    return samples
+
+
+#-----------------------------------------------------------------------------
+# 実行
+#-----------------------------------------------------------------------------
+async def run_load(args, url, server_pid, stop_event):
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_server(server_pid, stop))
+    t0 = time.time()
+    controllers = await asyncio.gather(*(
+        run_controller(url, i, args.rate, args.duration, args.test_interval)
+        for i in range(args.controllers)
+    ))
+    elapsed = time.time() - t0
+    stop_event.set()
+    stop.set()
+    return controllers, await sampler, elapsed
+
+
+def benchmark(args):
+    raise_fd_limit()
+    url = f"ws://127.0.0.1:{args.port}"
+    server_cmd = [sys.executable, SERVER_SCRIPT, "--host", "127.0.0.1", "--port", str(args.port),
+                  "--tick-rate", str(args.tick_rate)] + args.server_arg
+    server = subprocess.Popen(server_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              preexec_fn=raise_fd_limit)
+    try:
+        if not wait_for_port("127.0.0.1", args.port):
+            raise RuntimeError("サーバーが起動しませんでした")
+        baseline = read_proc_stats(server.pid)
+
+        # 表示クライアントをプロセスに分けて接続
+        ctx = mp.get_context("spawn")
+        results = ctx.Queue()
+        stop_event = ctx.Event()
+        procs = []
+        per_proc = [args.displays // args.procs + (1 if i < args.displays % args.procs else 0)
+                    for i in range(args.procs)]
+        for count in per_proc:
+            p = ctx.Process(target=display_worker,
+                            args=(url, count, stop_event, results, args.connect_concurrency))
+            p.start()
+            procs.append(p)
+
+        connected = failed = 0
+        for _ in procs:
+            _, ok, ng = results.get(timeout=300)
+            connected += ok
+            failed += ng
+        logging.info(f"表示クライアント {connected} 接続 (失敗 {failed})")
+        after_connect = read_proc_stats(server.pid)
+
+        controllers, samples, elapsed = asyncio.run(run_load(args, url, server.pid, stop_event))
+
+        displays = [results.get(timeout=60)[1] for _ in procs]
+        for p in procs:
+            p.join(timeout=30)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    latencies = [v for d in displays for v in d["latencies"]]
+    received = sum(d["received"] for d in displays)
+    sent = sum(c["sent"] for c in controllers)
+    rtts = [v for c in controllers for v in c["rtts"]]
+
+    server_stats = {}
+    if samples:
+        cpu_sec = samples[-1][1] - samples[0][1]
+        span = samples[-1][0] - samples[0][0]
+        server_stats = {
+            "cpu_percent": 100 * cpu_sec / span if span > 0 else 0.0,
+            "rss_mb_peak": max(s[2] for s in samples),
+            "rss_mb_idle": baseline[1] if baseline else None,
+            "rss_mb_after_connect": after_connect[1] if after_connect else None,
+        }
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "displays": args.displays, "controllers": args.controllers, "rate": args.rate,
+            "duration": args.duration, "tick_rate": args.tick_rate, "procs": args.procs,
+            "server_args": args.server_arg,
+        },
+        "connected": connected,
+        "connect_failed": failed,
+        "seconds": elapsed,
+        "sent": sent,
+        "sent_per_sec": sent / elapsed if elapsed else 0.0,
+        "received": received,
+        "received_per_sec": received / elapsed if elapsed else 0.0,
+        "fanout_latency_ms": percentiles(latencies),
+        "test_rtt_ms": percentiles(rtts),
+        "server": server_stats,
+    }
+
+
+def print_result(result, previous=None):
+    def fmt(stats):
+        if not stats:
+            return "-"
+        return f"p50={stats['p50']:.2f} p95={stats['p95']:.2f} p99={stats['p99']:.2f} max={stats['max']:.2f}"
+
+    print(f"接続: {result['connected']} (失敗 {result['connect_failed']})")
+    print(f"送信: {result['sent']} 件 ({result['sent_per_sec']:.1f} 件/秒)")
+    print(f"受信: {result['received']} 件 ({result['received_per_sec']:.1f} 件/秒)")
+    print(f"ファンアウト遅延 ms: {fmt(result['fanout_latency_ms'])}")
+    print(f"test 往復遅延 ms: {fmt(result['test_rtt_ms'])}")
+    if result["server"]:
+        s = result["server"]
+        print(f"サーバー: CPU {s['cpu_percent']:.1f}%, RSS ピーク {s['rss_mb_peak']:.1f} MB")
+
+    if previous:
+        print("前回との比較:")
+        for name in ("p50", "p95", "p99"):
+            a = (previous.get("fanout_latency_ms") or {}).get(name)
+            b = (result.get("fanout_latency_ms") or {}).get(name)
+            if a and b:
+                print(f"  遅延 {name}: {a:.2f} → {b:.2f} ms ({(b - a) / a * 100:+.1f}%)")
+        a, b = previous.get("received_per_sec"), result.get("received_per_sec")
+        if a and b:
+            print(f"  受信/秒: {a:.1f} → {b:.1f} ({(b - a) / a * 100:+.1f}%)")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Shader-Tyoimaru WebSocket Server Benchmark")
+    parser.add_argument("--displays", type=int, default=100, help="表示クライアント数 (デフォルト: 100)")
+    parser.add_argument("--controllers", type=int, default=1, help="コントローラー数 (デフォルト: 1)")
+    parser.add_argument("--rate", type=float, default=100, help="コントローラー1つあたりの送信レート 件/秒 (デフォルト: 100)")
+    parser.add_argument("--duration", type=float, default=10, help="計測時間 秒 (デフォルト: 10)")
+    parser.add_argument("--tick-rate", type=float, default=60, help="サーバーの --tick-rate (デフォルト: 60)")
+    parser.add_argument("--test-interval", type=float, default=0.5, help="test メッセージの間隔 秒 (デフォルト: 0.5)")
+    parser.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="表示クライアントを分けるプロセス数")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="同時に行う接続処理の数")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"サーバーのポート (デフォルト: {DEFAULT_PORT})")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="ws_server.py に渡す追加の引数 (複数指定可)。- で始まる値は "
+                             "--server-arg=--workers のように = でつなぐか、-- の後ろにまとめて書く")
+    parser.add_argument("--output", default="ws_bench_result.json", help="結果の JSON ファイル")
+    parser.add_argument("--compare", help="比較する前回の結果 JSON")
+    # "--" より後ろはそのまま ws_server.py に渡す
+    argv = sys.argv[1:]
+    server_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, server_args = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    args.server_arg += server_args
+    return args
+
+
+def main():
+    args = parse_arguments()
+    result = benchmark(args)
+    with open(args.output, "w") as fp:
+        json.dump(result, fp, indent=2, ensure_ascii=False)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as fp:
+            previous = json.load(fp)
+    print_result(result, previous)
+    print(f"結果を {args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
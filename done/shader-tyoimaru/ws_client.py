@@ -11,8 +11,11 @@ import json
 import logging
 import argparse
 import sys
+import time
 import websockets
 
+from param_schema import PARAMETERS, PARAMETER_NAMES, parse_parameters, encode_binary
+
 # ロギングの設定
 logging.basicConfig(
     format="%(asctime)s %(message)s",
@@ -22,8 +25,8 @@ logging.basicConfig(
 # デフォルト設定
 DEFAULT_SERVER = "localhost:8080"
 
-async def send_parameters(server_url, params):
-    """WebSocketサーバーにパラメータを送信する"""
+async def send_parameters(server_url, params, binary=False):
+    """WebSocketサーバーにパラメータを送信する (binary なら param_schema.py のバイナリ形式)"""
     try:
         # パラメータの検証
         logging.info(f"送信するパラメータ: {params}")
@@ -33,10 +36,15 @@ async def send_parameters(server_url, params):
         async with websockets.connect(f"ws://{server_url}") as websocket:
             logging.info(f"WebSocketサーバー {server_url} に接続しました")
             
-            # パラメータをJSONに変換して送信
-            json_data = json.dumps(params)
-            await websocket.send(json_data)
-            logging.info(f"パラメータを送信しました: {json_data}")
+            # パラメータをJSON (またはバイナリ) に変換して送信
+            frame = encode_binary(params) if binary else None
+            if frame is not None:
+                await websocket.send(frame)
+                logging.info(f"パラメータをバイナリで送信しました ({len(frame)} バイト): {params}")
+            else:
+                json_data = json.dumps(params)
+                await websocket.send(json_data)
+                logging.info(f"パラメータを送信しました: {json_data}")
             
             # サーバーからの応答を待機（オプション）
             try:
@@ -66,6 +74,150 @@ async def send_parameters(server_url, params):
         print(f"❌ エラー: {e}")
         sys.exit(1)
 
+class StreamStats:
+    """ストリームモードの送信数と往復遅延の統計"""
+
+    def __init__(self):
+        self.sent = 0
+        self.reconnects = 0
+        self.rtts = []
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.last_sent = 0
+
+    def report(self):
+        now = time.perf_counter()
+        rate = (self.sent - self.last_sent) / (now - self.last_report) if now > self.last_report else 0.0
+        self.last_report, self.last_sent = now, self.sent
+        line = f"送信 {self.sent} 件, {rate:.1f} 件/秒, 再接続 {self.reconnects} 回"
+        if self.rtts:
+            rtts = sorted(self.rtts)
+            p50 = rtts[len(rtts) // 2]
+            p95 = rtts[min(len(rtts) - 1, int(len(rtts) * 0.95))]
+            line += f", 往復遅延 p50={p50 * 1000:.2f}ms p95={p95 * 1000:.2f}ms (n={len(rtts)})"
+            self.rtts = []
+        logging.info(line)
+
+async def connect_with_retry(server_url, retry_interval=1.0, max_interval=10.0):
+    """接続できるまで再試行する (間隔は倍々に伸ばす)"""
+    interval = retry_interval
+    while True:
+        try:
+            websocket = await websockets.connect(f"ws://{server_url}")
+            logging.info(f"WebSocketサーバー {server_url} に接続しました")
+            return websocket
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            logging.warning(f"接続に失敗しました: {e} ({interval:.0f}秒後に再試行)")
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+async def receive_responses(websocket, pending_pings, stats):
+    """
+    サーバーからのメッセージを読み続ける。
+    テスト応答は往復遅延の計測に使い、それ以外 (ブロードキャストなど) は読み捨てる
+    """
+    try:
+        async for message in websocket:
+            if '"response"' not in message:
+                continue
+            try:
+                data = json.loads(message)
+            except json.JSONDecodeError:
+                continue
+            ping_id = data.get("received", {}).get("id")
+            sent_at = pending_pings.pop(ping_id, None)
+            if sent_at is not None:
+                stats.rtts.append(time.perf_counter() - sent_at)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+def read_lines(source):
+    """改行区切りJSONを1行ずつ返すジェネレーター (空行は飛ばす)"""
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+async def stream_parameters(server_url, source, rate=None, report_interval=5.0, rtt_interval=1.0,
+                            binary=False):
+    """
+    1本の接続を保ったまま、改行区切りJSONのパラメータを応答を待たずに送り続ける。
+    切断されたら再接続して続きから送る。rate を指定すると最大 rate 件/秒に制限する。
+    binary なら各行をバイナリ形式に変換して送る (パラメータ以外のキーを含む行はJSONのまま)
+    """
+    loop = asyncio.get_running_loop()
+    stats = StreamStats()
+    pending_pings = {}
+    lines = read_lines(source)
+    websocket = await connect_with_retry(server_url)
+    receiver = loop.create_task(receive_responses(websocket, pending_pings, stats))
+
+    interval = 1.0 / rate if rate else 0.0
+    next_send = time.perf_counter()
+    next_ping = next_send
+    next_report = next_send + report_interval
+    ping_id = 0
+    line = None
+    try:
+        while True:
+            if line is None:
+                # 標準入力の読み込みはブロックするので別スレッドで行う
+                line = await loop.run_in_executor(None, next, lines, None)
+                if line is None:
+                    break
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"JSONとして解析できない行を飛ばします: {line[:80]}")
+                    line = None
+                    continue
+                if binary and isinstance(data, dict) and PARAMETER_NAMES.issuperset(data):
+                    line = encode_binary(parse_parameters(data))
+
+            now = time.perf_counter()
+            if interval:
+                if next_send > now:
+                    await asyncio.sleep(next_send - now)
+                next_send = max(next_send + interval, now)
+
+            try:
+                await websocket.send(line)
+                stats.sent += 1
+                line = None
+
+                now = time.perf_counter()
+                if now >= next_ping:
+                    ping_id += 1
+                    pending_pings[ping_id] = now
+                    await websocket.send(json.dumps({"type": "test", "id": ping_id}))
+                    next_ping = now + rtt_interval
+            except websockets.exceptions.ConnectionClosed:
+                logging.warning("接続が切れました。再接続します")
+                receiver.cancel()
+                pending_pings.clear()
+                stats.reconnects += 1
+                websocket = await connect_with_retry(server_url)
+                receiver = loop.create_task(receive_responses(websocket, pending_pings, stats))
+                continue
+
+            if now >= next_report:
+                stats.report()
+                next_report = now + report_interval
+
+        # 最後の往復遅延の応答を少しだけ待つ
+        await asyncio.sleep(min(rtt_interval, 0.5))
+    finally:
+        stats.report()
+        receiver.cancel()
+        await websocket.close()
+    elapsed = time.perf_counter() - stats.started
+    print(f"✅ {stats.sent} 件を {elapsed:.2f} 秒で送信しました ({stats.sent / elapsed if elapsed else 0:.1f} 件/秒)")
+
 def parse_arguments():
     """コマンドライン引数の解析"""
     parser = argparse.ArgumentParser(description="Shader-Tyoimaru WebSocket Client")
@@ -74,72 +226,56 @@ def parse_arguments():
     parser.add_argument("--server", default=DEFAULT_SERVER, 
                         help=f"WebSocketサーバーのアドレス (デフォルト: {DEFAULT_SERVER})")
     
-    # 頂点シェーダーパラメータ
-    parser.add_argument("--timeScale", type=float, 
-                        help="時間変化の速度 (0.05〜0.3)")
-    parser.add_argument("--distortionAmount", type=float, 
-                        help="歪みの強さ (0.2〜0.8)")
-    parser.add_argument("--secondaryWaveAmplitude", type=float, 
-                        help="二次的な波の振幅 (0.05〜0.3)")
-    parser.add_argument("--bumpStrength", type=float, 
-                        help="膨らみの強さ (0.1〜0.4)")
-    
-    # フラグメントシェーダーパラメータ
-    parser.add_argument("--baseHue", type=float, 
-                        help="基本色相 (0〜1)")
-    parser.add_argument("--hueVariation", type=float, 
-                        help="色相の変化量 (0.1〜0.5)")
-    parser.add_argument("--hueTimeFactor", type=float, 
-                        help="色相の時間変化量 (0.05〜0.2)")
-    parser.add_argument("--timeSpeed", type=float, 
-                        help="ノイズの時間変化速度 (0.1〜0.4)")
-    parser.add_argument("--edgePower", type=float, 
-                        help="エッジ強調の強さ (1〜4)")
-    parser.add_argument("--pulseAmplitude", type=float, 
-                        help="脈動の強さ (0.02〜0.1)")
-    parser.add_argument("--pulseSpeed", type=float, 
-                        help="脈動の速度 (1〜4)")
-    
-    # その他のパラメータ
-    parser.add_argument("--rotationSpeed", type=float, 
-                        help="回転速度 (0.01〜0.1)")
-    parser.add_argument("--autoRotate", type=lambda x: (str(x).lower() == 'true'), 
-                        help="自動回転のON/OFF (true/false)")
-    parser.add_argument("--sphereDetail", type=int, 
-                        help="球体の詳細度 (12〜1024)")
+    # シェーダーパラメータ (param_schema.py の定義から作る)
+    for _, name, kind, lo, hi, description in PARAMETERS:
+        if kind == "bool":
+            parser.add_argument(f"--{name}", type=lambda x: (str(x).lower() == 'true'),
+                                help=f"{description} (true/false)")
+        else:
+            parser.add_argument(f"--{name}", type=int if kind == "int" else float,
+                                help=f"{description} ({lo:g}〜{hi:g})")
     
     # 制御コマンド
     parser.add_argument("--random", action="store_true", 
                         help="ランダムなパラメータを生成して送信")
     
+    # ストリームモード
+    parser.add_argument("--stream", nargs="?", const="-", metavar="FILE",
+                        help="接続を保ったまま改行区切りJSONのパラメータを送り続ける (FILE 省略時は標準入力)")
+    parser.add_argument("--rate", type=float,
+                        help="ストリームモードの最大送信レート (件/秒)")
+    parser.add_argument("--report", type=float, default=5.0,
+                        help="ストリームモードで統計を表示する間隔 (秒, デフォルト: 5)")
+    parser.add_argument("--binary", action="store_true",
+                        help="パラメータをバイナリ形式で送信する (JSONより小さい)")
+    
     return parser.parse_args()
 
 def generate_random_parameters():
     """ランダムなパラメータを生成（テスト用）"""
     import random
     
-    def random_range(min_val, max_val):
-        return min_val + random.random() * (max_val - min_val)
-    
+    # 連続値のパラメータをすべてスキーマの範囲内でランダムに設定
     return {
-        "timeScale": random_range(0.05, 0.3),
-        "distortionAmount": random_range(0.2, 0.8),
-        "secondaryWaveAmplitude": random_range(0.05, 0.3),
-        "bumpStrength": random_range(0.1, 0.4),
-        "baseHue": random_range(0, 1),
-        "hueVariation": random_range(0.1, 0.5),
-        "hueTimeFactor": random_range(0.05, 0.2),
-        "timeSpeed": random_range(0.1, 0.4),
-        "edgePower": random_range(1, 4),
-        "pulseAmplitude": random_range(0.02, 0.1),
-        "pulseSpeed": random_range(1, 4),
-        "rotationSpeed": random_range(0.01, 0.1)
+        name: lo + random.random() * (hi - lo)
+        for _, name, kind, lo, hi, _ in PARAMETERS
+        if kind == "float"
     }
 
 def main():
     """メイン関数"""
     args = parse_arguments()
     
+    # ストリームモード
+    if args.stream:
+        print(f"🔌 WebSocketサーバー {args.server} に接続して {'標準入力' if args.stream == '-' else args.stream} から送信します...")
+        try:
+            asyncio.run(stream_parameters(args.server, args.stream, args.rate, args.report,
+                                          binary=args.binary))
+        except KeyboardInterrupt:
+            logging.info("終了します")
+        return
+    
     # パラメータの収集
     params = {}
     
@@ -151,7 +287,7 @@ def main():
     
     # コマンドライン引数からパラメータを追加
     for arg_name, arg_value in vars(args).items():
-        if arg_name not in ["server", "random"] and arg_value is not None:
+        if arg_name in PARAMETER_NAMES and arg_value is not None:
             params[arg_name] = arg_value
     
     # パラメータが指定されているか確認
@@ -169,7 +305,7 @@ def main():
     print(f"🔌 WebSocketサーバー {args.server} に接続しています...")
     
     # パラメータの送信
-    asyncio.run(send_parameters(args.server, params))
+    asyncio.run(send_parameters(args.server, params, args.binary))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ws_server.py の計測とログ
+
+- Counter / Gauge / Histogram を Prometheus のテキスト形式で HTTP に公開する
+  (curl http://127.0.0.1:9100/metrics)
+- ログはイベントループでは QueueHandler にレコードを積むだけにし、
+  書式化と出力は別スレッドの QueueListener で行う
+- メッセージごとのログは SampleFilter で N 件に 1 件だけ残す
+"""
+
+import asyncio
+import bisect
+import logging
+import logging.handlers
+import queue
+import time
+
+# 秒単位のヒストグラムの境界 (50µs〜1s)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    """ラベルごとに増えるだけの値"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """スクレイプのたびに関数を呼んで現在値を得る"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help = help_text
+        self.func = func
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.func()}"]
+
+
+class Histogram:
+    """固定境界のヒストグラム (observe は bisect 1 回と加算だけ)"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    """with histogram.time(): ... でブロックの所要時間を記録する"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name, help_text, func):
+        return self._add(Gauge(name, help_text, func))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(registry, host, port):
+    """GET /metrics に Prometheus のテキスト形式で応答する最小限の HTTP サーバー"""
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            # ヘッダーは読み捨てる
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[1] in (b"/metrics", b"/"):
+                body = registry.render().encode()
+                status = b"200 OK"
+            else:
+                body = b"not found\n"
+                status = b"404 Not Found"
+            writer.write(b"HTTP/1.1 " + status + b"\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"メトリクスを http://{host}:{port}/metrics で公開します")
+    return server
+
+
+#-----------------------------------------------------------------------------
+# ログ
+#-----------------------------------------------------------------------------
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    書式化せずにレコードをキューに積む (標準の QueueHandler は積む前に書式化する)。
+    引数の dict などは書式化されるまで参照が残るので、ログに渡した後で変更しないこと
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """N 件に 1 件だけ通す (N <= 1 ならすべて通す)"""
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = max(1, int(every))
+        self.seen = 0
+
+    def filter(self, record):
+        self.seen += 1
+        return self.every == 1 or self.seen % self.every == 1
+
+
+def setup_logging(fmt="%(asctime)s %(message)s", level=logging.INFO, sample_every=1,
+                  sampled_logger="ws_server.messages"):
+    """
+    ルートロガーをキュー経由の非同期出力に切り替え、sampled_logger に SampleFilter を付ける。
+    戻り値の QueueListener は終了時に stop() する
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    sampled = logging.getLogger(sampled_logger)
+    for f in list(sampled.filters):
+        sampled.removeFilter(f)
+    sampled.addFilter(SampleFilter(sample_every))
+
+    listener.start()
+    return listener
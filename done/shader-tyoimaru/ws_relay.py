@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ws_server.py のワーカー間リレー (Unix ドメインソケット)
+
+--workers で複数プロセスに分けたとき、親プロセスがハブを立て、各ワーカーが接続する。
+ワーカーが publish したメッセージ (改行区切りJSON) は、送信元を含む全ワーカーに届く。
+全ワーカーがハブの受信順に同じ更新を反映するので、パラメータの状態はワーカー間で一致する。
+"retain" キーの付いたメッセージはキーごとに最新のものをハブが覚えておき、後から接続したワーカーにも送る
+("release" に並べたキーは忘れる)。
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+
+async def run_hub(path):
+    """ハブを起動する。受け取った行をそのまま全ワーカーに転送する"""
+    writers = set()
+    retained = {}  # retain キー → 最新の行
+
+    async def handle(reader, writer):
+        writers.add(writer)
+        for line in retained.values():
+            writer.write(line)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if b'"retain"' in line or b'"release"' in line:
+                    try:
+                        message = json.loads(line)
+                        release = list(message.get("release") or ())
+                        key = message.get("retain")
+                    except (ValueError, TypeError, AttributeError) as e:
+                        logging.warning(f"リレーの不正なメッセージを捨てました: {e}")
+                        continue
+                    for k in release:
+                        retained.pop(k, None)
+                    if key is not None:
+                        retained.pop(key, None)
+                        retained[key] = line
+                for w in writers:
+                    w.write(line)
+                # 書き込みが溜まったワーカーだけ待つ (ローカルなので通常はすぐ戻る)
+                for w in list(writers):
+                    if w.transport.get_write_buffer_size() > 1 << 20:
+                        await w.drain()
+        except ConnectionError:
+            pass
+        except ValueError as e:
+            # 長すぎる行 (readline の上限超え) を送ってきたワーカーだけ切断する
+            logging.warning(f"リレーのワーカーを切断します: {e}")
+        finally:
+            writers.discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path)
+    logging.info(f"ワーカー間リレーを起動しました: {path}")
+    return server
+
+
+class RelayClient:
+    """ワーカー側のハブへの接続"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, path, retries=50, interval=0.1):
+        for _ in range(retries):
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                return cls(reader, writer)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(interval)
+        raise ConnectionError(f"リレー {path} に接続できません")
+
+    def publish(self, data, retain=None, release=None):
+        """
+        全ワーカー (自分を含む) にメッセージを送る。retain を指定すると後から接続したワーカーにも届く。
+        release に retain キーを並べると、ハブが覚えているそのメッセージを忘れる
+        """
+        if retain is not None:
+            data = dict(data, retain=retain)
+        if release:
+            data = dict(data, release=release)
+        self.writer.write(json.dumps(data).encode() + b"\n")
+
+    async def listen(self, callback):
+        """
+        ハブから届いたメッセージごとに await callback(data) を呼ぶ。
+        1 件の処理で例外が起きてもログに残して次のメッセージに進む
+        """
+        while True:
+            try:
+                line = await self.reader.readline()
+            except ValueError as e:
+                raise ConnectionError(f"リレーから読めない行が届きました: {e}") from e
+            if not line:
+                raise ConnectionError("リレーとの接続が切れました")
+            try:
+                await callback(json.loads(line))
+            except Exception:
+                logging.exception("リレーのメッセージを処理できませんでした")
@@ -10,12 +10,27 @@ import asyncio
 import json
 import logging
 import random
+import signal
 import sys
 import socket
 import argparse
+import multiprocessing
+import os
+import tempfile
+import time
 import websockets
+from collections import deque
 from datetime import datetime
 
+from param_schema import (
+    PARAMETERS, PARAMETER_NAMES, coerce, parse_parameters,
+    encode_binary, decode_binary, schema_for_client,
+)
+from ws_relay import run_hub, RelayClient
+from ws_metrics import Registry, serve_metrics, setup_logging
+from ws_animation import AnimationEngine, validate_command
+from session_log import SessionRecorder, SessionReader, KIND_PARAMS, KIND_ANIMATE, KIND_SNAPSHOT
+
 # ロギングの設定
 logging.basicConfig(
     format="%(asctime)s %(message)s",
@@ -25,7 +40,205 @@ logging.basicConfig(
 # WebSocketサーバーの設定
 DEFAULT_HOST = "0.0.0.0"  # すべてのインターフェースでリッスン
 DEFAULT_PORT = 8080
-clients = set()
+
+# クライアントごとの送信キューの設定
+CLIENT_QUEUE_SIZE = 64  # これを超えて溜まったらパラメータごとに最新値だけを残す
+SEND_TIMEOUT = 5.0      # 1回の送信がこれ以上止まったクライアントは切断する
+
+# パラメータの差分をクライアントに送る頻度 (Hz)
+DEFAULT_TICK_RATE = 60
+
+# 起動時のパラメータ
+DEFAULT_PARAMETERS = {
+    # 頂点シェーダーパラメータ
+    "timeScale": 0.12,
+    "distortionAmount": 0.45,
+    "secondaryWaveAmplitude": 0.15,
+    "bumpStrength": 0.2,
+
+    # フラグメントシェーダーパラメータ
+    "baseHue": 0.7,
+    "hueVariation": 0.3,
+    "hueTimeFactor": 0.1,
+    "timeSpeed": 0.2,
+    "edgePower": 2.0,
+    "pulseAmplitude": 0.05,
+    "pulseSpeed": 2.0
+}
+
+clients = {}  # websocket → ClientConnection
+
+# メッセージごとのログ (--log-sample で間引く)
+msg_log = logging.getLogger("ws_server.messages")
+
+class ParameterState:
+    """
+    サーバーが持つ現在のシェーダーパラメータ
+
+    コントローラーからの更新はここにマージするだけで、変更されたキーは
+    tick ごとに差分としてまとめてブロードキャストする
+    """
+
+    def __init__(self, initial):
+        self.values = dict(initial)
+        self.dirty = {}
+
+    def update(self, data):
+        """パラメータのキーだけを (型をそろえて) マージし、値が変わったものを差分に記録する"""
+        for key, value in parse_parameters(data).items():
+            if self.values.get(key) != value:
+                self.values[key] = value
+                self.dirty[key] = value
+
+    def snapshot(self):
+        """全パラメータの現在値"""
+        return dict(self.values)
+
+    def send_now(self, params):
+        """すぐ送信する値を反映する (次の tick の差分からは外す)"""
+        for key, value in params.items():
+            self.values[key] = value
+            self.dirty.pop(key, None)
+
+    def take_delta(self):
+        """前回の tick 以降に変わったキーを取り出す"""
+        delta, self.dirty = self.dirty, {}
+        return delta
+
+state = ParameterState(DEFAULT_PARAMETERS)
+tick_rate = DEFAULT_TICK_RATE  # 0 なら更新を受け取るたびにすぐ送信する
+relay = None                  # --workers で複数プロセスにしたときのワーカー間リレー (RelayClient)
+engine = None                 # パラメータのアニメーション (AnimationEngine, main で作る)
+recorder = None               # --record のセッションログ (SessionRecorder)
+
+# メトリクス (--metrics-port で HTTP に公開する)
+metrics = Registry()
+messages_received = metrics.counter("ws_messages_received_total", "受信したメッセージ数 (種類別)")
+decode_seconds = metrics.histogram("ws_message_decode_seconds", "受信メッセージのデコード時間")
+handle_seconds = metrics.histogram("ws_message_handle_seconds", "受信メッセージの処理時間 (デコードを含む)")
+broadcast_seconds = metrics.histogram("ws_broadcast_seconds", "1回のブロードキャスト (エンコードと全クライアントへの enqueue) の時間")
+broadcast_frames = metrics.counter("ws_broadcast_frames_total", "ブロードキャストで送信キューに積んだフレーム数")
+keyframes_sent = metrics.counter("ws_keyframes_total", "アニメーションで送信したキーフレーム数 (パラメータごとに数える)")
+slow_disconnects = metrics.counter("ws_slow_client_disconnects_total", "送信が止まったため切断したクライアント数")
+messages_dropped = metrics.counter("ws_messages_dropped_total", "送信キューが一杯で破棄したメッセージ数 (パラメータ以外)")
+metrics.gauge("ws_connected_clients", "接続中のクライアント数", lambda: len(clients))
+metrics.gauge("ws_client_queue_depth_max", "クライアントの送信キューの最大の深さ",
+              lambda: max((c.backlog() for c in clients.values()), default=0))
+metrics.gauge("ws_client_queue_depth_sum", "全クライアントの送信キューの深さの合計",
+              lambda: sum(c.backlog() for c in clients.values()))
+metrics.gauge("ws_client_coalesced", "キューが一杯で最新値に集約した回数 (接続中のクライアントの合計)",
+              lambda: sum(c.coalesced_count for c in clients.values()))
+metrics.gauge("ws_client_dropped", "キューが一杯で破棄したメッセージ数 (接続中のクライアントの合計)",
+              lambda: sum(c.dropped for c in clients.values()))
+
+class ClientConnection:
+    """
+    クライアント1つ分の送信キュー
+
+    ブロードキャストはエンコード済みの文字列をキューに積むだけ (O(1)) で、
+    実際の送信はクライアントごとの送信タスクが行う。
+    遅いクライアントはキューが上限に達した時点でパラメータごとの最新値に集約し、
+    送信が SEND_TIMEOUT 以上進まなければ切断する。
+    応答 (hello や test への返事、接続時のスナップショットとキーフレーム) は別のキューに積んで
+    先に送り、破棄しない。
+    binary はクライアントが hello でバイナリ形式を選んだかどうか
+    """
+
+    def __init__(self, websocket, max_queue=CLIENT_QUEUE_SIZE, send_timeout=SEND_TIMEOUT):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.queue = deque()
+        self.control = deque()  # 破棄しない応答 (message, 送信後に呼ぶ関数)
+        self.coalesced = {}
+        self.coalesced_count = 0
+        self.dropped = 0
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.binary = False
+        self.task = asyncio.get_running_loop().create_task(self.writer())
+
+    def enqueue(self, message, data=None):
+        """
+        エンコード済みの message を積む。キューが一杯のときは、パラメータ dict (data) なら
+        最新値に集約し、それ以外は破棄する
+        """
+        if self.closed:
+            return
+        if len(self.queue) < self.max_queue and not self.coalesced:
+            self.queue.append(message)
+        elif data is not None:
+            self.coalesced.update(data)
+            self.coalesced_count += 1
+        else:
+            if not self.dropped:
+                logging.warning("送信キューが一杯のため、クライアントへのメッセージを破棄しました")
+            self.dropped += 1
+            messages_dropped.inc()
+        self.wakeup.set()
+
+    def send_control(self, message, on_sent=None):
+        """
+        応答を送る。通常のキューより先に送り、破棄しない。
+        on_sent を渡すと送信が終わった後に呼ぶ。
+        (応答は要求 1 件につき 1 件なので、受信しないクライアントでも SEND_TIMEOUT の切断までしか溜まらない)
+        """
+        if self.closed:
+            return
+        self.control.append((message, on_sent))
+        self.wakeup.set()
+
+    def encode(self, data):
+        """このクライアントの形式でパラメータ dict をエンコードする"""
+        if self.binary:
+            frame = encode_binary(data)
+            if frame is not None:
+                return frame
+        return json.dumps(data)
+
+    def backlog(self):
+        """未送信のメッセージ数"""
+        return len(self.control) + len(self.queue) + (1 if self.coalesced else 0)
+
+    async def writer(self):
+        """キューの中身を順に送信する"""
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.control or self.queue or self.coalesced:
+                    if self.control:
+                        frame, on_sent = self.control.popleft()
+                        await asyncio.wait_for(self.websocket.send(frame), timeout=self.send_timeout)
+                        if on_sent is not None:
+                            on_sent()
+                        continue
+                    if self.queue:
+                        frame = self.queue.popleft()
+                    else:
+                        # 集約した最新値は、溜まっていたキューより新しいので最後に送る
+                        frame = self.encode(self.coalesced)
+                        self.coalesced = {}
+                    await asyncio.wait_for(self.websocket.send(frame), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"送信が {self.send_timeout} 秒以上止まったクライアントを切断します")
+            slow_disconnects.inc()
+            self.closed = True
+            await self.websocket.close(code=1008, reason="client too slow")
+        except websockets.exceptions.ConnectionClosed:
+            self.closed = True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 送信タスクが止まると、接続したまま何も届かないクライアントになるので切断する
+            logging.exception("クライアントへの送信に失敗したため切断します")
+            self.closed = True
+            await self.websocket.close(code=1011, reason="internal error")
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.task.cancel()
 
 # 自分のIPアドレスを取得する関数
 def get_local_ip():
@@ -45,115 +258,331 @@ def get_local_ip():
 
 async def register(websocket):
     """クライアント接続の登録"""
-    clients.add(websocket)
+    clients[websocket] = ClientConnection(websocket)
     logging.info(f"新しいクライアントが接続しました (合計: {len(clients)})")
     
-    # 初期パラメータを送信
+    # 現在のパラメータを送信
     await send_initial_parameters(websocket)
 
 async def unregister(websocket):
     """クライアント接続の登録解除"""
-    clients.remove(websocket)
+    client = clients.pop(websocket)
+    client.close()
     logging.info(f"クライアントが切断しました (残り: {len(clients)})")
 
 async def send_initial_parameters(websocket):
-    """初期パラメータの送信"""
-    initial_params = {
-        # 頂点シェーダーパラメータ
-        "timeScale": 0.12,
-        "distortionAmount": 0.45,
-        "secondaryWaveAmplitude": 0.15,
-        "bumpStrength": 0.2,
-        
-        # フラグメントシェーダーパラメータ
-        "baseHue": 0.7,
-        "hueVariation": 0.3,
-        "hueTimeFactor": 0.1,
-        "timeSpeed": 0.2,
-        "edgePower": 2.0,
-        "pulseAmplitude": 0.05,
-        "pulseSpeed": 2.0
-    }
-    
-    await websocket.send(json.dumps(initial_params))
-    logging.info(f"初期パラメータを送信しました: {initial_params}")
+    """現在のパラメータ全体 (スナップショット) の送信"""
+    now = time.time()
+    initial_params = state.snapshot()
+    # アニメーション中のパラメータは現在の補間値にし、残りの区間をキーフレームで送る
+    initial_params.update(engine.current_values(now))
+    # キーフレームより先に届くように同じ応答のキューで送る
+    # (ブラウザはスナップショットを受け取るとそのパラメータの補間を止めるため)
+    clients[websocket].send_control(json.dumps(initial_params))
+    keyframes = engine.active_keyframes(now)
+    if keyframes:
+        clients[websocket].send_control(json.dumps(keyframe_message(keyframes, now)))
+    msg_log.info("現在のパラメータを送信しました: %s", initial_params)
 
 async def handle_message(websocket, message):
     """クライアントからのメッセージ処理"""
+    with handle_seconds.time():
+        await dispatch_message(websocket, message)
+
+async def dispatch_message(websocket, message):
+    """メッセージをデコードして種類ごとに処理する"""
     try:
-        data = json.loads(message)
-        logging.info(f"クライアントからメッセージを受信: {data}")
+        # バイナリフレームはパラメータ更新 (param_schema.py の形式)
+        if isinstance(message, bytes):
+            with decode_seconds.time():
+                data = decode_binary(message)
+            messages_received.inc(type="binary")
+            msg_log.info("クライアントからバイナリのパラメータを受信: %s", data)
+            await update_parameters(data)
+            return
+
+        with decode_seconds.time():
+            data = json.loads(message)
+        msg_log.info("クライアントからメッセージを受信: %s", data)
+        
+        # 形式のネゴシエーション: クライアントが対応する形式を伝えてくる
+        if data.get("type") == "hello":
+            messages_received.inc(type="hello")
+            client = clients[websocket]
+            use_binary = "binary" in data.get("formats", [])
+            response = {
+                "type": "hello",
+                "format": "binary" if use_binary else "json",
+                "schema": schema_for_client()
+            }
+
+            # スキーマが届く前にバイナリを送ると読めないので、応答を送り終えてから切り替える
+            def switch_format():
+                client.binary = use_binary
+
+            client.send_control(json.dumps(response), on_sent=switch_format)
+            msg_log.info("送信形式を %s にしました", response["format"])
         
         # テストメッセージの場合は応答を返す
-        if data.get("type") == "test":
+        elif data.get("type") == "test":
+            messages_received.inc(type="test")
             response = {
                 "type": "response",
                 "timestamp": datetime.now().timestamp() * 1000,
                 "message": "テスト接続成功",
                 "received": data
             }
-            await websocket.send(json.dumps(response))
-            logging.info(f"テスト応答を送信しました: {response}")
+            clients[websocket].send_control(json.dumps(response))
+            msg_log.info("テスト応答を送信しました: %s", response)
         
         # 制御メッセージの場合は全クライアントに転送
         elif data.get("type") == "control":
+            messages_received.inc(type="control")
             action = data.get("action")
             
             # 自動回転の切り替え
             if action == "toggleAutoRotate":
-                auto_rotate = data.get("autoRotate")
-                broadcast_data = {
-                    "autoRotate": auto_rotate
-                }
-                # 全クライアントに送信（送信元を除く）
-                await broadcast_to_others(websocket, broadcast_data)
+                # 値がないものは False とみなさずに不正なメッセージとして捨てる
+                auto_rotate = coerce("autoRotate", data.get("autoRotate"))
+                # 状態に反映し、全クライアントに送信（送信元を除く）
+                await update_parameters({"autoRotate": auto_rotate}, sender=websocket)
                 logging.info(f"自動回転状態を全クライアントに送信: {auto_rotate}")
         
+        # アニメーションの指示 (ws_animation.py)
+        elif data.get("type") == "animate":
+            messages_received.inc(type="animate")
+            data = validate_command(data)
+            await update_animation(data)
+            logging.info(f"アニメーションを設定: {data}")
+        
         # パラメータ更新メッセージの場合（ws_clientからの直接パラメータ）
         # typeフィールドがなく、シェーダーパラメータのキーが含まれている場合
-        elif any(key in data for key in [
-            "timeScale", "distortionAmount", "secondaryWaveAmplitude", "bumpStrength",
-            "baseHue", "hueVariation", "hueTimeFactor", "timeSpeed",
-            "edgePower", "pulseAmplitude", "pulseSpeed", "rotationSpeed",
-            "autoRotate", "sphereDetail"
-        ]):
-            # パラメータを全クライアントに送信（送信元を含む）
+        elif not PARAMETER_NAMES.isdisjoint(data):
+            # 型が合う値が1つもなければ不正なメッセージとして数える
+            params = parse_parameters(data)
+            if not params:
+                raise ValueError(f"有効なパラメータがありません: {data}")
+            messages_received.inc(type="param")
+            # 状態にマージし、次の tick で変更分を全クライアントに送信（送信元を含む）
             # 送信元を含むのは、送信元がws_clientの場合、ブラウザクライアントにも送信するため
-            await broadcast_to_all(data)
-            logging.info(f"ws_clientからのパラメータを全クライアントに送信: {data}")
+            await update_parameters(params)
+            msg_log.info("ws_clientからのパラメータを状態に反映: %s", params)
+        else:
+            messages_received.inc(type="other")
     except json.JSONDecodeError:
+        messages_received.inc(type="invalid")
         logging.error(f"JSONデータの解析に失敗: {message}")
+    except ValueError as e:
+        messages_received.inc(type="invalid")
+        logging.error(f"メッセージの内容が不正です: {e}")
     except Exception as e:
         logging.error(f"メッセージ処理中にエラーが発生: {e}")
 
+async def update_parameters(data, sender=None):
+    """
+    パラメータの更新。複数ワーカー構成ではリレーに送り、リレーから戻ってきた順に
+    全ワーカーで反映する (どのワーカーに繋いだコントローラーでも全クライアントに届く)。
+    sender を指定すると tick を待たずに送信し、送信元には送り返さない
+    """
+    if relay is not None:
+        message = {"params": data}
+        if sender is not None:
+            message["origin"] = origin_of(sender)
+        # 直接設定されたパラメータのアニメーションは、後から接続したワーカーにも送らない
+        relay.publish(message,
+                      release=[f"animate:{key}" for key in PARAMETER_NAMES.intersection(data)])
+    else:
+        await apply_parameters(data, sender)
+
+def origin_of(websocket):
+    """ワーカーをまたいで送信元のクライアントを識別する文字列"""
+    return f"{os.getpid()}:{id(websocket)}"
+
+async def update_animation(command, start=None):
+    """
+    アニメーションの指示を反映する。開始時刻と乱数の種をここで決めるので、
+    複数ワーカー構成でも全ワーカーで同じキーフレームになる
+    """
+    command = dict(command, start=start or time.time())
+    command.setdefault("seed", random.getrandbits(32))
+    if relay is not None:
+        relay.publish({"animate": command}, retain=f"animate:{command['param']}")
+    else:
+        apply_animation(command)
+
+async def on_relay_message(message):
+    """リレーから届いたメッセージの処理"""
+    if "params" in message:
+        origin = message.get("origin")
+        if origin is None:
+            await apply_parameters(message["params"])
+        else:
+            # 送信元が別のワーカーのクライアントなら、このワーカーでは全員に送る
+            sender = next((ws for ws in clients if origin_of(ws) == origin), False)
+            await apply_parameters(message["params"], sender)
+    elif "animate" in message:
+        apply_animation(message["animate"])
+
+def apply_animation(command):
+    """アニメーションの指示をエンジンに渡す"""
+    engine.command(command, state.values)
+    if recorder is not None:
+        recorder.record(KIND_ANIMATE, command)
+
+async def apply_parameters(data, sender=None):
+    """
+    パラメータを状態にマージする (tick_rate が 0 なら差分をすぐ送信)。
+    sender を指定すると、すぐに送信元以外の全クライアントに送る (False なら全員)
+    """
+    params = parse_parameters(data)
+    if recorder is not None:
+        recorder.record(KIND_PARAMS, params)
+    # 直接設定された値はアニメーションより優先する (アニメーション中だったものは必ず送り直す)
+    for key in engine.release(params):
+        state.values.pop(key, None)
+    if sender is not None:
+        state.send_now(params)
+        if params:
+            await broadcast_to_others(sender, params)
+        return
+    state.update(params)
+    if tick_rate <= 0:
+        delta = state.take_delta()
+        if delta:
+            await broadcast_to_all(delta)
+
+async def tick_loop(rate):
+    """
+    一定間隔で変更されたパラメータだけを送信する。
+    コントローラーがどれだけ速く送っても、クライアントへの送信は最大 rate 回/秒
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / rate
+    next_tick = loop.time()
+    while True:
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        delta = state.take_delta()
+        if delta:
+            await broadcast_to_all(delta)
+
+def scale_animation(command, speed):
+    """再生速度に合わせてアニメーションの時間を縮める"""
+    command = dict(command)
+    for key in ("duration", "period", "interval"):
+        if key in command:
+            command[key] = float(command[key]) / speed
+    command.pop("start", None)
+    return command
+
+async def replay_session(path, speed=1.0, offset=0.0):
+    """
+    セッションログを通常の更新経路 (update_parameters / update_animation) に流し直す。
+    offset 秒の位置から始め、speed 倍の速さで再生する
+    """
+    reader = SessionReader(path)
+    loop = asyncio.get_running_loop()
+    snapshot_t = await asyncio.to_thread(reader.seek, offset)
+    log_start = max(snapshot_t, reader.started + offset)
+    wall_start = loop.time()
+    logging.info(f"セッションログ {path} を {offset:g} 秒の位置から {speed:g} 倍速で再生します")
+
+    # 開始位置より前のレコード (スナップショットからの追いつき) はまとめて1回で反映する
+    catchup_params = {}
+    catchup_animations = {}
+    catching_up = True
+    count = 0
+
+    async def finish_catchup():
+        await update_parameters(catchup_params)
+        for command in catchup_animations.values():
+            await update_animation(scale_animation(command, speed))
+
+    try:
+        while True:
+            batch = await asyncio.to_thread(reader.read_batch)
+            if not batch:
+                break
+            for t, kind, data in batch:
+                count += 1
+                if catching_up:
+                    if t < log_start:
+                        if kind == KIND_SNAPSHOT:
+                            catchup_params.update(data["params"])
+                            catchup_animations = dict(data["animations"])
+                        elif kind == KIND_PARAMS:
+                            catchup_params.update(data)
+                            for key in data:
+                                catchup_animations.pop(key, None)
+                        elif kind == KIND_ANIMATE:
+                            if data.get("kind") != "stop":
+                                catchup_animations[data["param"]] = data
+                            elif data.get("param") == "*":
+                                catchup_animations.clear()
+                            else:
+                                catchup_animations.pop(data.get("param"), None)
+                        continue
+                    catching_up = False
+                    await finish_catchup()
+
+                delay = (t - log_start) / speed - (loop.time() - wall_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # 途中のスナップショットは差分の積み重ねと同じ内容なので飛ばす
+                if kind == KIND_PARAMS:
+                    await update_parameters(data)
+                elif kind == KIND_ANIMATE:
+                    await update_animation(scale_animation(data, speed))
+        if catching_up:
+            await finish_catchup()
+    finally:
+        reader.close()
+    logging.info(f"セッションログの再生が終わりました ({count} 件)")
+
+def keyframe_message(segments, now):
+    return {
+        "type": "keyframe",
+        "params": {param: seg.to_message(now) for param, seg in segments.items()}
+    }
+
+def send_keyframes(segments):
+    """新しく始まったアニメーションの区間を全クライアントに送る (ブラウザが補間する)"""
+    for param, seg in segments.items():
+        # 状態には区間の目標値を持っておく (差分としては送らない)
+        state.values[param] = seg.to
+    keyframes_sent.inc(len(segments))
+    broadcast(keyframe_message(segments, time.time()), coalesce=False)
+
 async def broadcast_to_others(sender, data):
     """送信元を除く全クライアントにデータを送信"""
-    if not clients:
-        return
-    
-    # 送信元を除く全クライアントに送信
-    websockets_tasks = [
-        client.send(json.dumps(data))
-        for client in clients
-        if client != sender
-    ]
-    
-    if websockets_tasks:
-        await asyncio.gather(*websockets_tasks, return_exceptions=True)
+    broadcast(data, exclude=sender)
 
 async def broadcast_to_all(data):
     """全クライアントにデータを送信"""
+    broadcast(data)
+
+def broadcast(data, exclude=None, coalesce=True):
+    """
+    data を形式ごとに1回だけエンコードし、各クライアントの送信キューに積む。
+    遅いクライアントを待たないので、コストはクライアント数に比例する enqueue だけ。
+    coalesce=False のメッセージ (パラメータの dict でないもの) はキューが一杯なら破棄される
+    """
     if not clients:
         return
-    
-    # 全クライアントに送信
-    websockets_tasks = [
-        client.send(json.dumps(data))
-        for client in clients
-    ]
-    
-    if websockets_tasks:
-        await asyncio.gather(*websockets_tasks, return_exceptions=True)
+    start = time.perf_counter()
+    message = json.dumps(data)
+    frame = None
+    pending = data if coalesce else None
+    for websocket, client in clients.items():
+        if websocket is not exclude:
+            if client.binary:
+                if frame is None:
+                    frame = encode_binary(data) or message
+                client.enqueue(frame, pending)
+            else:
+                client.enqueue(message, pending)
+    broadcast_frames.inc(len(clients) - (exclude in clients))
+    broadcast_seconds.observe(time.perf_counter() - start)
 
 def random_range(min_val, max_val):
     """指定された範囲内のランダムな数値を生成"""
@@ -162,46 +591,12 @@ def random_range(min_val, max_val):
 def generate_random_parameters():
     """ランダムなパラメータの生成"""
     # 更新するパラメータをランダムに選択（すべてを一度に変更しない）
-    params = {}
-    all_params = [
-        "timeScale", "distortionAmount", "secondaryWaveAmplitude", "bumpStrength",
-        "baseHue", "hueVariation", "hueTimeFactor", "timeSpeed",
-        "edgePower", "pulseAmplitude", "pulseSpeed", "rotationSpeed"
-    ]
-    
-    # ランダムに1〜3個のパラメータを選択
-    num_params = random.randint(1, 3)
-    random.shuffle(all_params)
-    selected_params = all_params[:num_params]
+    # 対象は連続値のパラメータだけ (autoRotate と sphereDetail は変えない)
+    candidates = [p for p in PARAMETERS if p[2] == "float"]
     
-    # 選択したパラメータにランダムな値を設定
-    for param in selected_params:
-        if param == "timeScale":
-            params["timeScale"] = random_range(0.05, 0.3)
-        elif param == "distortionAmount":
-            params["distortionAmount"] = random_range(0.2, 0.8)
-        elif param == "secondaryWaveAmplitude":
-            params["secondaryWaveAmplitude"] = random_range(0.05, 0.3)
-        elif param == "bumpStrength":
-            params["bumpStrength"] = random_range(0.1, 0.4)
-        elif param == "baseHue":
-            params["baseHue"] = random_range(0, 1)
-        elif param == "hueVariation":
-            params["hueVariation"] = random_range(0.1, 0.5)
-        elif param == "hueTimeFactor":
-            params["hueTimeFactor"] = random_range(0.05, 0.2)
-        elif param == "timeSpeed":
-            params["timeSpeed"] = random_range(0.1, 0.4)
-        elif param == "edgePower":
-            params["edgePower"] = random_range(1, 4)
-        elif param == "pulseAmplitude":
-            params["pulseAmplitude"] = random_range(0.02, 0.1)
-        elif param == "pulseSpeed":
-            params["pulseSpeed"] = random_range(1, 4)
-        elif param == "rotationSpeed":
-            params["rotationSpeed"] = random_range(0.01, 0.1)
-    
-    return params
+    # ランダムに1〜3個のパラメータを選択し、スキーマの範囲内の値を設定
+    selected = random.sample(candidates, random.randint(1, 3))
+    return {name: random_range(lo, hi) for _, name, _, lo, hi, _ in selected}
 
 # 定期的なパラメータ送信機能は削除されました
 
@@ -220,11 +615,34 @@ async def ws_handler(websocket, path=None):
     finally:
         await unregister(websocket)
 
-async def main(host, port):
-    """メイン関数"""
+async def main(host, port, reuse_port=False, relay_path=None, metrics_port=None,
+               auto_animate=None, record_path=None, replay=None, primary=True):
+    """
+    メイン関数 (reuse_port と relay_path は複数ワーカー構成のワーカーとして動くとき)
+    auto_animate 秒ごとに全パラメータをランダムウォークさせる指示、セッションの記録 (record_path)、
+    再生 (replay = (パス, 速度, 開始位置)) は primary のワーカーだけが行う
+    (全ワーカーの更新はリレーを通るので、1か所で記録・再生すれば足りる)
+    """
+    global relay, engine, recorder
     try:
+        engine = AnimationEngine(send_keyframes)
+        animator = asyncio.create_task(engine.run(lambda: state.values))  # noqa: F841 (タスクの参照を保持)
+        
+        if metrics_port:
+            # メトリクスはローカルからだけ見られるようにする
+            metrics_server = await serve_metrics(metrics, "127.0.0.1", metrics_port)  # noqa: F841 (参照を保持)
+        
+        listener = None
+        if relay_path:
+            relay = await RelayClient.connect(relay_path)
+            listener = asyncio.create_task(relay.listen(on_relay_message))
+        
         # WebSocketサーバーの起動
-        server = await websockets.serve(ws_handler, host, port)
+        if reuse_port:
+            # 同じポートを複数のワーカーで共有し、カーネルが接続を振り分ける
+            server = await websockets.serve(ws_handler, host, port, reuse_port=True)
+        else:
+            server = await websockets.serve(ws_handler, host, port)
         local_ip = get_local_ip()
         
         logging.info(f"WebSocketサーバーを起動しました")
@@ -235,9 +653,37 @@ async def main(host, port):
         logging.info("Ctrl+Cで終了します")
         
         # 定期的なパラメータ送信機能は削除されました
+        # (変更されたパラメータだけを tick ごとに送信する)
+        if tick_rate > 0:
+            logging.info(f"パラメータの差分を {tick_rate} 回/秒で送信します")
+            ticker = asyncio.create_task(tick_loop(tick_rate))  # noqa: F841 (タスクの参照を保持)
         
+        # 定期的なランダム変更はアニメーション (ブラウザ側で補間) として行う
+        if auto_animate and primary:
+            logging.info(f"全パラメータを {auto_animate} 秒ごとにランダムに変化させます")
+            # 開始時刻をそろえて、キーフレームを1つのメッセージにまとめる
+            start = time.time()
+            for _, name, kind, *_ in PARAMETERS:
+                if kind == "float":
+                    await update_animation({"type": "animate", "param": name, "kind": "walk",
+                                            "interval": auto_animate}, start)
+
+        # セッションの記録と再生
+        if record_path and primary:
+            recorder = SessionRecorder(record_path, state.snapshot())
+            logging.info(f"セッションを {record_path} に記録します")
+        if replay and primary:
+            replayer = asyncio.create_task(replay_session(*replay))  # noqa: F841 (タスクの参照を保持)
+
         # サーバーを永続的に実行
-        await server.wait_closed()
+        if listener is None:
+            await server.wait_closed()
+        else:
+            # 親プロセスが終了してリレーが切れたらワーカーも終了する
+            await asyncio.wait([asyncio.ensure_future(server.wait_closed()), listener],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if listener.done():
+                logging.info("リレーが切断されたため終了します")
     except OSError as e:
         logging.error(f"サーバー起動エラー: {e}")
         if e.errno == 98:
@@ -248,15 +694,108 @@ async def main(host, port):
     except Exception as e:
         logging.error(f"予期しないエラーが発生しました: {e}")
         sys.exit(1)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+def worker_main(host, port, rate, relay_path, index, log_sample=1, options=None):
+    """
+    複数ワーカー構成のワーカープロセス。options は main に渡すキーワード引数
+    (メトリクスのポートは metrics_port + index)
+    """
+    global tick_rate
+    tick_rate = rate
+    options = dict(options or {})
+    if options.get("metrics_port"):
+        options["metrics_port"] += index
+    listener = setup_logging(f"%(asctime)s [worker {index}] %(message)s", sample_every=log_sample)
+    try:
+        asyncio.run(main(host, port, reuse_port=True, relay_path=relay_path, primary=index == 0, **options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+
+async def run_sharded(host, port, workers, log_sample=1, options=None):
+    """
+    リレーのハブを立ててから、ポートを共有するワーカープロセスを workers 個起動する。
+    クライアントはカーネル (SO_REUSEPORT) によってワーカーに振り分けられる
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        logging.error("この環境は SO_REUSEPORT に対応していないため --workers は使えません")
+        sys.exit(1)
+    
+    relay_path = os.path.join(tempfile.gettempdir(), f"ws_server_relay_{os.getpid()}.sock")
+    hub = await run_hub(relay_path)
+    
+    # SIGTERM でも後片付け (ワーカーの停止とソケットファイルの削除) をする
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=worker_main, args=(host, port, tick_rate, relay_path, i, log_sample, options),
+                    daemon=True)
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    logging.info(f"{workers} 個のワーカーでポート {port} を共有します")
+    
+    try:
+        # どれかのワーカーが終了したら全体を止める
+        while all(p.is_alive() for p in procs) and not stop.is_set():
+            await asyncio.sleep(0.5)
+        if not stop.is_set():
+            logging.error("ワーカーが終了したため、サーバーを停止します")
+    finally:
+        for p in procs:
+            p.terminate()
+        hub.close()
+        if os.path.exists(relay_path):
+            os.unlink(relay_path)
 
 if __name__ == "__main__":
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description="Shader-Tyoimaru WebSocket Server")
     parser.add_argument("--host", default=DEFAULT_HOST, help=f"ホスト名またはIPアドレス (デフォルト: {DEFAULT_HOST})")
     parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"ポート番号 (デフォルト: {DEFAULT_PORT})")
+    parser.add_argument("--tick-rate", type=float, default=DEFAULT_TICK_RATE,
+                        help=f"パラメータの差分を送信する頻度 Hz, 0 で即時送信 (デフォルト: {DEFAULT_TICK_RATE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="ポートを共有するワーカープロセス数 (デフォルト: 1 = 単一プロセス)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="メトリクスを http://127.0.0.1:<port>/metrics で公開する (ワーカーごとに +0, +1, ...)")
+    parser.add_argument("--log-sample", type=int, default=1,
+                        help="メッセージごとのログを N 件に 1 件だけ出力する (デフォルト: 1 = すべて)")
+    parser.add_argument("--auto-animate", type=float, metavar="SECONDS",
+                        help="全パラメータを SECONDS 秒ごとにランダムに変化させる (ブラウザ側で滑らかに補間)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="パラメータの更新とアニメーションの指示をセッションログに記録する")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="セッションログを再生する (通常の更新と同じく全クライアントに送信)")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="再生速度の倍率 (デフォルト: 1)")
+    parser.add_argument("--replay-from", type=float, default=0.0, metavar="SECONDS",
+                        help="再生を始める位置 (記録開始からの秒数, デフォルト: 0)")
     args = parser.parse_args()
-    
+    tick_rate = args.tick_rate
+
+    options = {
+        "metrics_port": args.metrics_port,
+        "auto_animate": args.auto_animate,
+        "record_path": args.record,
+        "replay": (args.replay, args.replay_speed, args.replay_from) if args.replay else None,
+    }
+
+    # ログの書式化と出力は別スレッドで行う
+    log_listener = setup_logging(sample_every=args.log_sample)
     try:
-        asyncio.run(main(args.host, args.port))
+        if args.workers > 1:
+            asyncio.run(run_sharded(args.host, args.port, args.workers, args.log_sample, options))
+        else:
+            asyncio.run(main(args.host, args.port, **options))
     except KeyboardInterrupt:
         logging.info("サーバーを終了します")
+    finally:
+        log_listener.stop()
@@ -0,0 +1,245 @@
+"""
+fft.py の係数をブラウザに段階的に配信する WebSocket サーバー。
+係数セットはメモリ上の LRU キャッシュに置き、振幅の大きい順にチャンクに分けて
+バイナリで送る。ブラウザ (main.js / fftWorker.js) は最初のチャンクで粗い画像を描き、
+チャンクが届くたびに描き足していく。
+
+    python coeff_server.py --root ./images --port 8765
+    (ブラウザで index.html?image=photo.png&k=20000 を開く)
+
+要求 (ブラウザ → サーバー, JSON):
+    {"type": "coeffs", "image": "photo.png", "numCoeffs": 20000, "hermitian": true}
+    image は --root からの相対パス。画像なら fft.py で抽出し、
+    fft.py --format binary の出力 (.bin) ならそのまま読む。
+
+応答 (サーバー → ブラウザ):
+    {"type": "header", "shape": [h, w], "hermitian": true, "counts": [nr, ng, nb], "chunks": n}
+    バイナリのチャンク × n
+    {"type": "done"}    (失敗したときは {"type": "error", "message": ...})
+
+チャンク (little endian):
+    CHUNK_HEADER: 種類 uint8 (FRAME_CHUNK), 予約 uint8, チャンク番号 uint16, r/g/b の成分数 uint32 × 3
+    amplitude float32 × (r, g, b の順に成分数の合計)
+    fx int16 × 合計, fy int16 × 合計, phase uint16 × 合計 ([-π, π] を 0〜65535 に量子化)
+    1 成分 10 バイト (coeffs_format は 16 バイト、JSON は 80 バイト前後)。
+    各チャンクは前のチャンクの続きの範囲で、最初は小さく、後になるほど大きくなる。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+from collections import OrderedDict
+
+import numpy as np
+import websockets
+
+from coeffs_format import CHANNELS, load_coeffs_binary
+from fft import compute_fft_spectra_color, compute_fft_spectra_lowmem
+from fft_batch import IMAGE_EXTS
+
+logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO)
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8765
+
+FRAME_CHUNK  = 1
+CHUNK_HEADER = struct.Struct("<BxHIII")
+MAX_INDEX    = 32767  # fx / fy を int16 に収められる上限
+
+
+class CoeffCache:
+    """
+    エンコード済みのチャンク列の LRU キャッシュ (合計バイト数で制限)。
+    同じキーの計算が進行中なら、その結果を待って共有する
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries   = OrderedDict()  # キー → (header, chunks, バイト数)
+        self.pending   = {}             # キー → 計算中の Future
+        self.size      = 0
+        self.hits      = 0
+        self.misses    = 0
+
+    async def get(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][:2]
+        if key in self.pending:
+            self.hits += 1
+            return await asyncio.shield(self.pending[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            header, chunks = await asyncio.to_thread(compute)
+        except BaseException as e:
+            # 計算した要求が失敗・キャンセルされても、同じキーを待っている要求は必ず起こす
+            if isinstance(e, Exception):
+                future.set_exception(e)
+            else:
+                future.set_exception(RuntimeError("係数の計算が中断されました"))
+            # 待っている要求がなければ例外を読んだことにしておく
+            future.exception()
+            raise
+        finally:
+            del self.pending[key]
+        future.set_result((header, chunks))
+        self._put(key, header, chunks)
+        return header, chunks
+
+    def _put(self, key, header, chunks):
+        nbytes = sum(len(c) for c in chunks)
+        if nbytes > self.max_bytes:
+            return
+        self.entries[key] = (header, chunks, nbytes)
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+
+def chunk_bounds(count, first=256, largest=16384):
+    """成分数 count → チャンクの (start, stop) の列。最初は first 成分、以降倍々で largest まで"""
+    bounds = []
+    start, size = 0, first
+    while start < count:
+        stop = min(count, start + size)
+        bounds.append((start, stop))
+        start, size = stop, min(size * 2, largest)
+    return bounds
+
+
+def encode_chunk(spectra, index, start, stop):
+    """各チャンネルの [start, stop) の成分を 1 つのチャンクにまとめる"""
+    cols   = [{k: np.asarray(spectra[ch][k])[start:stop] for k in ('fx', 'fy', 'amplitude', 'phase')}
+              for ch in CHANNELS]
+    counts = [len(c['amplitude']) for c in cols]
+    phase  = np.concatenate([c['phase'] for c in cols]).astype(np.float64)
+    q      = np.rint((phase + np.pi) * (65535 / (2 * np.pi)))
+    parts  = [
+        CHUNK_HEADER.pack(FRAME_CHUNK, index, *counts),
+        np.concatenate([c['amplitude'] for c in cols]).astype('<f4').tobytes(),
+        np.concatenate([c['fx'] for c in cols]).astype('<i2').tobytes(),
+        np.concatenate([c['fy'] for c in cols]).astype('<i2').tobytes(),
+        np.clip(q, 0, 65535).astype('<u2').tobytes(),
+    ]
+    return b''.join(parts)
+
+
+def encode_spectra(spectra, first=256, largest=16384):
+    """spectra → (ヘッダー dict, チャンクの bytes のリスト)"""
+    h, w = spectra['shape']
+    if max(h, w) // 2 > MAX_INDEX:
+        raise ValueError(f"{w}×{h} は大きすぎます (1 辺 {2 * MAX_INDEX} まで)")
+    counts = [len(spectra[ch]['amplitude']) for ch in CHANNELS]
+    chunks = [encode_chunk(spectra, i, start, stop)
+              for i, (start, stop) in enumerate(chunk_bounds(max(counts), first, largest))]
+    header = {
+        'type': 'header',
+        'shape': [h, w],
+        'hermitian': bool(spectra.get('hermitian')),
+        'counts': counts,
+        'chunks': len(chunks),
+    }
+    return header, chunks
+
+
+def load_or_compute(path, num_coeffs, hermitian, low_memory=False):
+    """.bin なら読み込み (先頭 num_coeffs 成分)、画像なら fft.py で抽出する"""
+    if path.lower().endswith(IMAGE_EXTS):
+        if low_memory:
+            return compute_fft_spectra_lowmem(path, num_coeffs, hermitian=hermitian)
+        return compute_fft_spectra_color(path, num_coeffs, hermitian=hermitian)
+    data = load_coeffs_binary(path)
+    for ch in CHANNELS:
+        data[ch] = {k: v[:num_coeffs] for k, v in data[ch].items()}
+    return data
+
+
+class CoeffServer:
+    def __init__(self, root, cache_mb=256, default_coeffs=10000, max_coeffs=200000,
+                 first_chunk=256, max_chunk=16384, low_memory=False):
+        self.root           = os.path.realpath(root)
+        self.cache          = CoeffCache(int(cache_mb * 1024 * 1024))
+        self.default_coeffs = default_coeffs
+        self.max_coeffs     = max_coeffs
+        self.first_chunk    = first_chunk
+        self.max_chunk      = max_chunk
+        self.low_memory     = low_memory
+
+    def resolve(self, name):
+        """--root 以下のファイルだけを許可する"""
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            raise ValueError(f"ファイルが見つかりません: {name}")
+        return path
+
+    async def stream(self, websocket, request):
+        path       = self.resolve(str(request.get('image', '')))
+        num_coeffs = min(int(request.get('numCoeffs') or self.default_coeffs), self.max_coeffs)
+        hermitian  = bool(request.get('hermitian', True))
+        st         = os.stat(path)
+        key        = (path, st.st_mtime_ns, st.st_size, num_coeffs, hermitian)
+
+        def compute():
+            spectra = load_or_compute(path, num_coeffs, hermitian, self.low_memory)
+            return encode_spectra(spectra, self.first_chunk, self.max_chunk)
+
+        header, chunks = await self.cache.get(key, compute)
+        await websocket.send(json.dumps(header))
+        # send は送信バッファが空くまで待つので、遅いクライアントの分がメモリに溜まらない
+        for chunk in chunks:
+            await websocket.send(chunk)
+        await websocket.send(json.dumps({'type': 'done'}))
+        logging.info(f"{os.path.relpath(path, self.root)} ({num_coeffs} 成分, {len(chunks)} チャンク) を送信しました "
+                     f"(キャッシュ {self.cache.size / 1e6:.1f} MB, ヒット {self.cache.hits} / ミス {self.cache.misses})")
+
+    async def handler(self, websocket):
+        try:
+            async for message in websocket:
+                try:
+                    request = json.loads(message)
+                    if request.get('type') != 'coeffs':
+                        raise ValueError(f"未対応の要求です: {request.get('type')}")
+                    await self.stream(websocket, request)
+                except (ValueError, TypeError, OSError, RuntimeError) as e:
+                    logging.warning(f"要求を処理できません: {e}")
+                    await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def main(host, port, server):
+    async with websockets.serve(server.handler, host, port, max_size=1 << 16):
+        logging.info(f"係数サーバーを起動しました: ws://{host}:{port} (ルート: {server.root})")
+        await asyncio.Future()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="FFT 係数を段階的に配信する WebSocket サーバー")
+    parser.add_argument("--root", default=".", help="画像と係数ファイルを置くディレクトリ (デフォルト: .)")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"ホスト (デフォルト: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"ポート番号 (デフォルト: {DEFAULT_PORT})")
+    parser.add_argument("--cache-mb", type=float, default=256, help="キャッシュの上限 MB (デフォルト: 256)")
+    parser.add_argument("--num-coeffs", type=int, default=10000,
+                        help="要求に numCoeffs がないときの係数の数 (デフォルト: 10000)")
+    parser.add_argument("--max-coeffs", type=int, default=200000, help="1 チャンネルあたりの係数の上限 (デフォルト: 200000)")
+    parser.add_argument("--first-chunk", type=int, default=256, help="最初のチャンクの成分数 (デフォルト: 256)")
+    parser.add_argument("--max-chunk", type=int, default=16384, help="チャンクの成分数の上限 (デフォルト: 16384)")
+    parser.add_argument("--low-memory", action="store_true", help="fft.py の省メモリモードで抽出する")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    server = CoeffServer(args.root, args.cache_mb, args.num_coeffs, args.max_coeffs,
+                         args.first_chunk, args.max_chunk, args.low_memory)
+    try:
+        asyncio.run(main(args.host, args.port, server))
+    except KeyboardInterrupt:
+        logging.info("サーバーを終了します")
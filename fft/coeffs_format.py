@@ -0,0 +1,214 @@
+"""
+Columnar binary container for FFT coefficients.
+
+Layout (little endian, all columns 4-byte aligned):
+    header  HEADER_DTYPE (32 bytes): magic, version, flags, h, w, count per channel
+    body    for each channel in CHANNELS:
+                fx[count] int32, fy[count] int32,
+                amplitude[count] float32, phase[count] float32
+
+fx / fy are signed integer frequency indices (kx = fx / w, ky = fy / h),
+amplitude is normalised by h*w exactly like the JSON export.
+
+flags:
+    FLAG_HERMITIAN  only one coefficient of each conjugate pair is stored;
+                    every coefficient that is not its own conjugate counts twice.
+
+Sequence container (fft.py --sequence), written and read as a stream:
+    header  SEQ_HEADER_DTYPE (24 bytes): magic, version, flags, h, w, num_coeffs
+    frames  FRAME_DTYPE (20 bytes): kind, frame index, count per channel,
+            followed by the same four columns per channel as above
+
+A FRAME_KEY record holds the full coefficient set and replaces the
+decoder state. A FRAME_DELTA record only holds the coefficients that were
+added or changed since the state the decoder already has; an amplitude of
+exactly 0 removes the coefficient at (fx, fy).
+"""
+import numpy as np
+
+MAGIC    = b'FFTC'
+VERSION  = 1
+CHANNELS = ('r', 'g', 'b')
+
+FLAG_HERMITIAN = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic',    'S4'),
+    ('version',  '<u2'),
+    ('flags',    '<u2'),
+    ('h',        '<u4'),
+    ('w',        '<u4'),
+    ('counts',   '<u4', (len(CHANNELS),)),
+    ('reserved', '<u4'),
+])
+
+COLUMNS = (('fx', '<i4'), ('fy', '<i4'), ('amplitude', '<f4'), ('phase', '<f4'))
+ROW_BYTES = sum(np.dtype(dtype).itemsize for _, dtype in COLUMNS)
+
+SEQ_MAGIC = b'FFTS'
+
+SEQ_HEADER_DTYPE = np.dtype([
+    ('magic',      'S4'),
+    ('version',    '<u2'),
+    ('flags',      '<u2'),
+    ('h',          '<u4'),
+    ('w',          '<u4'),
+    ('num_coeffs', '<u4'),
+    ('reserved',   '<u4'),
+])
+
+FRAME_KEY   = 1
+FRAME_DELTA = 2
+
+FRAME_DTYPE = np.dtype([
+    ('kind',     'u1'),
+    ('pad',      'u1', (3,)),
+    ('index',    '<u4'),
+    ('counts',   '<u4', (len(CHANNELS),)),
+])
+
+
+def save_coeffs_binary(spectra, path, flags=0):
+    """
+    spectra: {'shape': [h, w], 'r': {'fx', 'fy', 'amplitude', 'phase'}, 'g': ..., 'b': ...}
+    An optional spectra['hermitian'] sets FLAG_HERMITIAN.
+    """
+    h, w = spectra['shape']
+    if spectra.get('hermitian'):
+        flags |= FLAG_HERMITIAN
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic']   = MAGIC
+    header['version'] = VERSION
+    header['flags']   = flags
+    header['h']       = h
+    header['w']       = w
+    header['counts']  = [len(spectra[ch]['amplitude']) for ch in CHANNELS]
+
+    with open(path, 'wb') as fp:
+        fp.write(header.tobytes())
+        for ch in CHANNELS:
+            for name, dtype in COLUMNS:
+                fp.write(np.ascontiguousarray(spectra[ch][name], dtype=dtype).tobytes())
+
+
+def load_coeffs_binary(path, mmap=True):
+    """
+    Load a file written by save_coeffs_binary. With mmap=True the columns are
+    read-only views into a memory map, so nothing is parsed or copied up front.
+    Returns the same structure that save_coeffs_binary accepts, plus 'flags'
+    and 'hermitian'.
+    """
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        buf = np.fromfile(path, dtype=np.uint8)
+
+    header = buf[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError(f"{path} is not an FFT coefficient file")
+    if header['version'] != VERSION:
+        raise ValueError(f"unsupported coefficient file version: {header['version']}")
+
+    out = {
+        'shape': [int(header['h']), int(header['w'])],
+        'flags': int(header['flags']),
+        'hermitian': bool(header['flags'] & FLAG_HERMITIAN),
+    }
+    offset = HEADER_DTYPE.itemsize
+    for ch, count in zip(CHANNELS, header['counts'].tolist()):
+        columns = {}
+        for name, dtype in COLUMNS:
+            nbytes = count * np.dtype(dtype).itemsize
+            columns[name] = buf[offset:offset + nbytes].view(dtype)
+            offset += nbytes
+        out[ch] = columns
+    return out
+
+
+class SequenceWriter:
+    """
+    Append frames to a sequence container. fp is any binary file object
+    (a pipe works too); every frame is flushed as soon as it is written.
+    """
+
+    def __init__(self, fp, shape, num_coeffs=0, hermitian=False):
+        self.fp = fp
+        header = np.zeros(1, dtype=SEQ_HEADER_DTYPE)
+        header['magic']      = SEQ_MAGIC
+        header['version']    = VERSION
+        header['flags']      = FLAG_HERMITIAN if hermitian else 0
+        header['h']          = shape[0]
+        header['w']          = shape[1]
+        header['num_coeffs'] = num_coeffs or 0
+        fp.write(header.tobytes())
+        self.bytes = header.nbytes
+
+    def write_frame(self, kind, index, channels):
+        """channels: one {'fx', 'fy', 'amplitude', 'phase'} column dict per channel"""
+        record = np.zeros(1, dtype=FRAME_DTYPE)
+        record['kind']   = kind
+        record['index']  = index
+        record['counts'] = [len(c['amplitude']) for c in channels]
+        parts = [record.tobytes()]
+        for c in channels:
+            for name, dtype in COLUMNS:
+                parts.append(np.ascontiguousarray(c[name], dtype=dtype).tobytes())
+        data = b''.join(parts)
+        self.fp.write(data)
+        self.fp.flush()
+        self.bytes += len(data)
+
+
+def _read_exact(fp, n):
+    data = fp.read(n)
+    while 0 < len(data) < n:
+        more = fp.read(n - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def read_sequence_header(fp):
+    """Read the header of a sequence stream: {'shape', 'num_coeffs', 'flags', 'hermitian'}"""
+    raw = _read_exact(fp, SEQ_HEADER_DTYPE.itemsize)
+    if len(raw) < SEQ_HEADER_DTYPE.itemsize:
+        raise ValueError("not an FFT coefficient sequence")
+    header = np.frombuffer(raw, dtype=SEQ_HEADER_DTYPE)[0]
+    if header['magic'] != SEQ_MAGIC:
+        raise ValueError("not an FFT coefficient sequence")
+    if header['version'] != VERSION:
+        raise ValueError(f"unsupported sequence version: {header['version']}")
+    return {
+        'shape': [int(header['h']), int(header['w'])],
+        'num_coeffs': int(header['num_coeffs']),
+        'flags': int(header['flags']),
+        'hermitian': bool(header['flags'] & FLAG_HERMITIAN),
+    }
+
+
+def iter_sequence_frames(fp):
+    """
+    Yield (kind, index, channels) for every complete frame record that
+    follows the header. Stops at EOF or at a truncated last record.
+    """
+    while True:
+        raw = _read_exact(fp, FRAME_DTYPE.itemsize)
+        if len(raw) < FRAME_DTYPE.itemsize:
+            return
+        record = np.frombuffer(raw, dtype=FRAME_DTYPE)[0]
+        counts = record['counts'].tolist()
+        nbytes = sum(counts) * ROW_BYTES
+        body   = _read_exact(fp, nbytes)
+        if len(body) < nbytes:
+            return
+        channels = []
+        offset   = 0
+        for count in counts:
+            columns = {}
+            for name, dtype in COLUMNS:
+                nbytes = count * np.dtype(dtype).itemsize
+                columns[name] = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+                offset += nbytes
+            channels.append(columns)
+        yield int(record['kind']), int(record['index']), channels
@@ -1,9 +1,154 @@
+import argparse
+import contextlib
+import os
+import re
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 import json
 
-def compute_fft_coeffs_gray(f, num_coeffs):
-    """入力 f: 2D numpy(float32) → 上位 num_coeffs 成分を返す"""
+from coeffs_format import CHANNELS, FRAME_DELTA, FRAME_KEY, SequenceWriter, save_coeffs_binary
+
+def _signed_freq_index(i, n):
+    """fftfreq(n) の並びのインデックス i → 符号付き周波数インデックス"""
+    return np.where(i < (n + 1) // 2, i, i - n)
+
+def _self_columns(ix, w):
+    """kx = 0 列と (w が偶数なら) kx = w/2 列: 共役相手が同じ列の中にある"""
+    self_col = ix == 0
+    if w % 2 == 0:
+        self_col |= ix == w // 2
+    return self_col
+
+def _pair_weight(iy, ix, shape, hermitian):
+    """
+    半スペクトルの各成分が全スペクトルで何成分分に当たるか (1 or 2)。
+    hermitian=True では共役ペアの片方だけを残すので、自己共役な点以外は 2
+    """
+    h, w = shape
+    self_col = _self_columns(ix, w)
+    if not hermitian:
+        return np.where(self_col, 1, 2)
+    self_pt = self_col & (iy == 0)
+    if h % 2 == 0:
+        self_pt |= self_col & (iy == h // 2)
+    return np.where(self_pt, 1, 2)
+
+def _top_half(flat_amp, k):
+    """半スペクトルの振幅 flat_amp から上位 k 個のインデックス (順不同)"""
+    if k < flat_amp.size:
+        return np.argpartition(flat_amp, flat_amp.size - k)[flat_amp.size - k:]
+    return np.arange(flat_amp.size)
+
+def _select_by_energy(flat_amp, shape, hermitian, energy, total_energy):
+    """
+    振幅の大きい順に、累積エネルギーが total_energy * energy に達するまでの
+    半スペクトル成分のインデックスを返す。候補数を 4 倍ずつ増やしながら部分選択する
+    """
+    h, w = shape
+    wr     = w // 2 + 1
+    target = total_energy * energy
+    m      = 1024
+    while True:
+        m     = min(m, flat_amp.size)
+        cand  = _top_half(flat_amp, m)
+        cand  = cand[np.argsort(-flat_amp[cand], kind='stable')]
+        iy, ix = np.divmod(cand, wr)
+        a     = np.maximum(flat_amp[cand], 0).astype(np.float64)
+        cum   = np.cumsum(_pair_weight(iy, ix, shape, hermitian) * a * a)
+        if cum[-1] >= target or m == flat_amp.size:
+            cand = cand[:int(np.searchsorted(cum, target)) + 1]
+            return cand[flat_amp[cand] >= 0]
+        m *= 4
+
+def top_k_spectrum(f, num_coeffs, hermitian=False, energy=None):
+    """
+    実数入力 FFT (rfft2) + 部分選択で上位 num_coeffs 成分を求める高速パス。
+    戻り値: (fx, fy, amplitude, phase) の配列。fx, fy は符号付き整数の周波数インデックス
+    (kx = fx / w, ky = fy / h)、amplitude / phase は float32。振幅の降順に並ぶ。
+
+    hermitian=True: 共役ペア (kx,ky) / (-kx,-ky) の片方だけを返す。
+        自己共役な成分 (直流など) 以外は再構成時に振幅を 2 倍して使う。
+    energy=0.99 など: 個数ではなく、全スペクトルのエネルギーの割合で打ち切る
+        (num_coeffs も指定されていればそれを上限とする)。
+    """
+    h, w = f.shape
+    # 実数画像のスペクトルはエルミート対称なので半分 (h × (w//2+1)) だけ計算する
+    F     = np.fft.rfft2(np.asarray(f, dtype=np.float32))
+    F     = F.astype(np.complex64, copy=False)
+    amp   = np.abs(F)
+    amp  /= np.float32(h * w)
+
+    flat_amp = amp.ravel()
+    total    = h * w
+    k        = total if not num_coeffs else min(num_coeffs, total)
+
+    if energy is not None:
+        # 全スペクトルのエネルギー (自己共役な列は 1 回、それ以外は 2 回数える)
+        sq = amp.astype(np.float64) ** 2
+        total_energy = 2 * sq.sum() - sq[:, _self_columns(np.arange(amp.shape[1]), w)].sum()
+    if hermitian:
+        # 自己共役な列の下半分は上半分の共役なので候補から外す
+        amp[h // 2 + 1:, _self_columns(np.arange(amp.shape[1]), w)] = -1
+
+    if energy is not None:
+        cand = _select_by_energy(flat_amp, (h, w), hermitian, energy, total_energy)
+        if hermitian:
+            k = min(k, cand.size)
+        else:
+            iy, ix = np.divmod(cand, w // 2 + 1)
+            k = min(k, int(_pair_weight(iy, ix, (h, w), False).sum()))
+    else:
+        # 全スペクトルの上位 k 成分は、半スペクトルの上位 k 成分とその共役の中に必ず含まれる
+        cand = _top_half(flat_amp, k)
+        if hermitian:
+            cand = cand[flat_amp[cand] >= 0]
+    iy, ix = np.divmod(cand, w // 2 + 1)
+    return _expand_half_spectrum(iy, ix, F.ravel()[cand], flat_amp[cand], (h, w), k,
+                                 expand=not hermitian)
+
+def _expand_half_spectrum(iy, ix, vals, amp, shape, k, expand=True):
+    """
+    半スペクトルの候補 (行 iy, 列 ix, 複素値 vals, 正規化振幅 amp) に共役側を補い、
+    全スペクトルでの上位 k 成分 (fx, fy, amplitude, phase) を振幅の降順で返す。
+    expand=False なら共役側は補わず、候補を並べ替えるだけ
+    """
+    h, w = shape
+    if expand:
+        paired = ~_self_columns(ix, w)
+        iy   = np.concatenate([iy, (-iy[paired]) % h])
+        ix   = np.concatenate([ix, (-ix[paired]) % w])
+        vals = np.concatenate([vals, np.conj(vals[paired])])
+        amp  = np.concatenate([amp, amp[paired]])
+
+    # 振幅が等しい成分 (共役ペアなど) は全スペクトルでの位置順に並べて結果を決定的にする
+    order = np.lexsort((iy * w + ix, -amp))[:k]
+    fx    = _signed_freq_index(ix[order], w)
+    fy    = _signed_freq_index(iy[order], h)
+    return fx, fy, amp[order], np.angle(vals[order]).astype(np.float32)
+
+def spectrum_to_coeffs(fx, fy, amp, ph, shape):
+    """top_k_spectrum の配列 → JSON 用 dict のリスト"""
+    h, w = shape
+    # fftfreq と同じ値になるようにテーブルから引く
+    kx = np.fft.fftfreq(w)[fx % w]
+    ky = np.fft.fftfreq(h)[fy % h]
+    return [
+        {'kx': x, 'ky': y, 'amplitude': a, 'phase': p}
+        for x, y, a, p in zip(kx.tolist(), ky.tolist(), amp.tolist(), ph.tolist())
+    ]
+
+def compute_fft_coeffs_gray(f, num_coeffs, fast=True):
+    """
+    入力 f: 2D numpy(float32) → 上位 num_coeffs 成分を返す
+    fast=True なら rfft2 + 部分選択、False なら従来の fft2 + 全ソート
+    """
+    if fast:
+        return spectrum_to_coeffs(*top_k_spectrum(f, num_coeffs), f.shape)
+
     h, w = f.shape
     F     = np.fft.fft2(f)
     F2    = np.fft.fftshift(F)
@@ -33,7 +178,7 @@ def compute_fft_coeffs_gray(f, num_coeffs):
         })
     return coeffs
 
-def compute_fft_coeffs_color(image_path, num_coeffs=None):
+def compute_fft_coeffs_color(image_path, num_coeffs=None, fast=True):
     """
     1. 画像をRGBで読み込み
     2. 各チャンネルごとに FFT → 上位 num_coeffs を抽出
@@ -44,9 +189,9 @@ def compute_fft_coeffs_color(image_path, num_coeffs=None):
     h, w, _ = arr.shape
 
     # 各チャンネル分
-    coeffs_r = compute_fft_coeffs_gray(arr[:, :, 0], num_coeffs)
-    coeffs_g = compute_fft_coeffs_gray(arr[:, :, 1], num_coeffs)
-    coeffs_b = compute_fft_coeffs_gray(arr[:, :, 2], num_coeffs)
+    coeffs_r = compute_fft_coeffs_gray(arr[:, :, 0], num_coeffs, fast)
+    coeffs_g = compute_fft_coeffs_gray(arr[:, :, 1], num_coeffs, fast)
+    coeffs_b = compute_fft_coeffs_gray(arr[:, :, 2], num_coeffs, fast)
 
     return {
         'shape': [h, w],
@@ -55,13 +200,372 @@ def compute_fft_coeffs_color(image_path, num_coeffs=None):
         'b': coeffs_b
     }
 
+def compute_fft_spectra_color(image_path, num_coeffs=None, hermitian=False, energy=None):
+    """
+    compute_fft_coeffs_color の配列版。
+    各チャンネルを {'fx', 'fy', 'amplitude', 'phase'} の列 (numpy 配列) で返す。
+    hermitian / energy は top_k_spectrum を参照
+    """
+    img = Image.open(image_path).convert('RGB')
+    arr = np.array(img, dtype=np.float32)
+    h, w, _ = arr.shape
+
+    out = {'shape': [h, w], 'hermitian': hermitian}
+    for i, ch in enumerate(CHANNELS):
+        fx, fy, amp, ph = top_k_spectrum(arr[:, :, i], num_coeffs, hermitian, energy)
+        out[ch] = {'fx': fx, 'fy': fy, 'amplitude': amp, 'phase': ph}
+    return out
+
+def _rfft2_blocked(chan, spec, block):
+    """
+    chan (h, w) uint8 の rfft2 を spec (h, w//2+1) complex64 に書き込む。
+    行方向 rfft → 列方向 fft をブロック単位で行うので、作業領域は block 行/列分だけ
+    """
+    h, wr = spec.shape
+    for r0 in range(0, h, block):
+        spec[r0:r0 + block] = np.fft.rfft(chan[r0:r0 + block].astype(np.float32), axis=1)
+    for c0 in range(0, wr, block):
+        spec[:, c0:c0 + block] = np.fft.fft(spec[:, c0:c0 + block], axis=0)
+
+def _top_k_streaming(spec, k, norm, block, hermitian=False, w=None):
+    """
+    spec を行ブロックごとに走査し、振幅上位 k 個の (平坦化インデックス, 振幅) を保持する。
+    保持する候補は高々 k + block 行分。
+    hermitian=True では自己共役な列の下半分 (上半分の共役) を候補から外す
+    """
+    h, wr = spec.shape
+    if hermitian:
+        self_cols = _self_columns(np.arange(wr), w)
+    best_idx = np.empty(0, dtype=np.int64)
+    best_amp = np.empty(0, dtype=np.float32)
+    for r0 in range(0, spec.shape[0], block):
+        amp = np.abs(spec[r0:r0 + block]).ravel()
+        amp /= norm
+        if hermitian and r0 + block > h // 2 + 1:
+            amp = amp.reshape(-1, wr)
+            amp[max(h // 2 + 1 - r0, 0):, self_cols] = -1
+            amp = amp.ravel()
+        idx = np.arange(r0 * wr, r0 * wr + amp.size)
+        # 既に k 個あるなら現在の最小値以下の成分は候補にならない
+        if best_amp.size >= k:
+            keep = amp > best_amp.min()
+            amp, idx = amp[keep], idx[keep]
+        best_idx = np.concatenate([best_idx, idx])
+        best_amp = np.concatenate([best_amp, amp])
+        if best_amp.size > k:
+            top = np.argpartition(best_amp, best_amp.size - k)[best_amp.size - k:]
+            best_idx, best_amp = best_idx[top], best_amp[top]
+    keep = best_amp >= 0
+    return best_idx[keep], best_amp[keep]
+
+def compute_fft_spectra_lowmem(image_path, num_coeffs=None, block=256, workdir=None, hermitian=False):
+    """
+    compute_fft_spectra_color の省メモリ版。
+    - チャンネルを 1 つずつ uint8 のまま取り出す (RGB 全体の float32 配列は作らない)
+    - 半スペクトル用のバッファを 1 つだけ確保して全チャンネルで使い回す
+      (workdir を指定するとそのディレクトリの memmap にする)
+    - fftshift のコピーや meshgrid は作らず、上位 K 成分はブロック単位で逐次選択する
+    energy による打ち切りは全体のソートが要るので、このモードでは扱わない
+    """
+    img = Image.open(image_path).convert('RGB')
+    w, h = img.size
+    wr   = w // 2 + 1
+    k    = h * w if not num_coeffs else min(num_coeffs, h * w)
+
+    if workdir:
+        fd, spec_path = tempfile.mkstemp(suffix='.spec', dir=workdir)
+        os.close(fd)
+        spec = np.memmap(spec_path, dtype=np.complex64, mode='w+', shape=(h, wr))
+    else:
+        spec_path = None
+        spec = np.empty((h, wr), dtype=np.complex64)
+
+    try:
+        out = {'shape': [h, w], 'hermitian': hermitian}
+        for ch in CHANNELS:
+            chan = np.asarray(img.getchannel(ch.upper()))
+            _rfft2_blocked(chan, spec, block)
+            del chan
+            cand, amp = _top_k_streaming(spec, k, np.float32(h * w), block, hermitian, w)
+            iy, ix = np.divmod(cand, wr)
+            fx, fy, a, ph = _expand_half_spectrum(iy, ix, spec.ravel()[cand], amp, (h, w), k,
+                                                  expand=not hermitian)
+            out[ch] = {'fx': fx, 'fy': fy, 'amplitude': a, 'phase': ph}
+    finally:
+        del spec
+        if spec_path:
+            os.remove(spec_path)
+    return out
+
+def peak_rss_mb():
+    """
+    このプロセスのピーク RSS (MB)。resource モジュールのない環境 (Windows) では None。
+    ru_maxrss の単位は Linux では KB、macOS では バイト
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def spectra_to_json(spectra):
+    """
+    列形式の spectra → 従来の JSON 用 dict。
+    hermitian モードでは 'hermitian': true を付ける (自己共役でない成分は振幅 2 倍で再構成)
+    """
+    out = {'shape': list(spectra['shape'])}
+    if spectra.get('hermitian'):
+        out['hermitian'] = True
+    for ch in CHANNELS:
+        c = spectra[ch]
+        out[ch] = spectrum_to_coeffs(c['fx'], c['fy'], c['amplitude'], c['phase'], spectra['shape'])
+    return out
+
+#-----------------------------------------------------------------------------
+# 連番画像・動画 (シーケンスモード)
+#-----------------------------------------------------------------------------
+def natural_key(name):
+    """ファイル名の数字部分を数値として比べるキー (frame2.png < frame10.png)"""
+    return [(0, int(part), part) if part.isdigit() else (1, 0, part)
+            for part in re.split(r'(\d+)', name) if part]
+
+def iter_frames_folder(folder):
+    """
+    フォルダ直下の画像をファイル名の自然順 (数字は数値として比較) に (h, w, 3) uint8 で返す。
+    サブフォルダは見ない
+    """
+    # fft_batch は fft を import するので、ここで読み込む
+    from fft_batch import IMAGE_EXTS
+    names = sorted((name for name in os.listdir(folder)
+                    if name.lower().endswith(IMAGE_EXTS) and os.path.isfile(os.path.join(folder, name))),
+                   key=natural_key)
+    for name in names:
+        with Image.open(os.path.join(folder, name)) as img:
+            yield np.asarray(img.convert('RGB'))
+
+def iter_frames_raw(fp, w, h):
+    """
+    rgb24 の生フレームが並んだストリーム (ffmpeg -f rawvideo -pix_fmt rgb24 の出力など) を
+    1 フレームずつ返す。最後の不完全なフレームは捨てる
+    """
+    size = w * h * 3
+    while True:
+        buf = fp.read(size)
+        while 0 < len(buf) < size:
+            more = fp.read(size - len(buf))
+            if not more:
+                break
+            buf += more
+        if len(buf) < size:
+            return
+        yield np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3)
+
+def _frame_spectra(frame, num_coeffs, hermitian):
+    return [top_k_spectrum(frame[:, :, i], num_coeffs, hermitian) for i in range(len(CHANNELS))]
+
+def sequence_spectra(frames, num_coeffs, hermitian=False, workers=2):
+    """
+    フレームのイテレーター → 各フレームのチャンネルごとの (fx, fy, amplitude, phase) を順に返す。
+    FFT はスレッドプールで workers フレーム先まで計算しておく (numpy の FFT は GIL を解放する)。
+    先読みは workers フレーム分だけなので、長い動画でもメモリは増えない
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+        for frame in frames:
+            window.append(pool.submit(_frame_spectra, frame, num_coeffs, hermitian))
+            if len(window) > workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+def _wrap_phase(d):
+    return (d + np.pi) % (2 * np.pi) - np.pi
+
+def _columns(fx, fy, amp, ph):
+    return {'fx': fx, 'fy': fy, 'amplitude': amp, 'phase': ph}
+
+class DeltaEncoder:
+    """
+    チャンネルごとに「デコーダーが持っている係数」を覚えておき、
+    新しいフレームとの差分 (追加・変化・削除) だけを返す。
+    比較の基準は前のフレームではなく送信済みの値なので、許容誤差以下の変化が積み重なって
+    ずれていくことはない。
+    変化とみなす条件: 振幅の相対変化 > amp_tol または 位相の変化 > phase_tol (ラジアン)
+    """
+
+    def __init__(self, shape, amp_tol=0.02, phase_tol=0.05, keyframe_interval=0):
+        self.shape             = shape
+        self.amp_tol           = amp_tol
+        self.phase_tol         = phase_tol
+        self.keyframe_interval = keyframe_interval
+        self.state             = None  # チャンネルごとの {'key', 'fx', 'fy', 'amplitude', 'phase'} (key 順)
+        self.frames            = 0
+
+    def _key(self, fx, fy):
+        h, w = self.shape
+        return (np.asarray(fy, dtype=np.int64) % h) * w + np.asarray(fx, dtype=np.int64) % w
+
+    def _sorted_state(self, fx, fy, amp, ph):
+        key   = self._key(fx, fy)
+        order = np.argsort(key, kind='stable')
+        return {'key': key[order], 'fx': fx[order], 'fy': fy[order],
+                'amplitude': amp[order], 'phase': ph[order]}
+
+    def _delta(self, old, fx, fy, amp, ph):
+        """1 チャンネル分の差分の列と新しい状態"""
+        new = self._sorted_state(fx, fy, amp, ph)
+        _, i_old, i_new = np.intersect1d(old['key'], new['key'], assume_unique=True, return_indices=True)
+
+        a_old   = old['amplitude'][i_old]
+        changed = ((np.abs(new['amplitude'][i_new] - a_old) > self.amp_tol * a_old)
+                   | (np.abs(_wrap_phase(new['phase'][i_new] - old['phase'][i_old])) > self.phase_tol))
+        # 変化しなかった成分はデコーダーの持っている値のまま
+        kept = ~changed
+        for name in ('amplitude', 'phase'):
+            new[name][i_new[kept]] = old[name][i_old[kept]]
+
+        send = np.ones(new['key'].size, dtype=bool)
+        send[i_new[kept]] = False
+        removed = np.ones(old['key'].size, dtype=bool)
+        removed[i_old] = False
+
+        n = int(removed.sum())
+        delta = _columns(
+            np.concatenate([new['fx'][send], old['fx'][removed]]),
+            np.concatenate([new['fy'][send], old['fy'][removed]]),
+            np.concatenate([new['amplitude'][send], np.zeros(n, dtype=np.float32)]),
+            np.concatenate([new['phase'][send], np.zeros(n, dtype=np.float32)]),
+        )
+        return delta, new
+
+    def encode(self, spectra):
+        """
+        spectra: チャンネルごとの (fx, fy, amplitude, phase)
+        戻り値: (FRAME_KEY または FRAME_DELTA, チャンネルごとの列)
+        """
+        keyframe = (self.state is None
+                    or (self.keyframe_interval and self.frames % self.keyframe_interval == 0))
+        self.frames += 1
+        if keyframe:
+            # キーフレームは振幅の降順のまま送る
+            self.state = [self._sorted_state(*sp) for sp in spectra]
+            return FRAME_KEY, [_columns(*sp) for sp in spectra]
+
+        channels = []
+        for c, sp in enumerate(spectra):
+            delta, self.state[c] = self._delta(self.state[c], *sp)
+            channels.append(delta)
+        return FRAME_DELTA, channels
+
+def encode_sequence(frames, fp, num_coeffs, hermitian=False, amp_tol=0.02, phase_tol=0.05,
+                    keyframe_interval=0, workers=2):
+    """
+    フレームのイテレーターを読みながらシーケンスを fp に書き出す (1 フレームずつ flush)。
+    統計 dict (frames, keyframes, coeffs_sent, coeffs_full, bytes) を返す
+    """
+    writer = encoder = None
+    stats  = {'frames': 0, 'keyframes': 0, 'coeffs_sent': 0, 'coeffs_full': 0, 'bytes': 0}
+    frames = iter(frames)
+    first  = next(frames, None)
+    if first is None:
+        return stats
+    shape  = first.shape[:2]
+
+    def checked():
+        yield first
+        for frame in frames:
+            if frame.shape[:2] != shape:
+                raise ValueError(f"フレームのサイズが違います: {frame.shape[1]}×{frame.shape[0]}")
+            yield frame
+
+    writer  = SequenceWriter(fp, shape, num_coeffs, hermitian)
+    encoder = DeltaEncoder(shape, amp_tol, phase_tol, keyframe_interval)
+    for index, spectra in enumerate(sequence_spectra(checked(), num_coeffs, hermitian, workers)):
+        kind, channels = encoder.encode(spectra)
+        writer.write_frame(kind, index, channels)
+        stats['frames']      += 1
+        stats['keyframes']   += kind == FRAME_KEY
+        stats['coeffs_sent'] += sum(len(c['amplitude']) for c in channels)
+        stats['coeffs_full'] += sum(len(sp[2]) for sp in spectra)
+    stats['bytes'] = writer.bytes
+    return stats
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="画像の FFT 係数を抽出して保存する")
+    parser.add_argument("image", nargs="?", default="./image.png", help="入力画像 (デフォルト: ./image.png)")
+    parser.add_argument("--num-coeffs", type=int,
+                        help="各チャンネルの係数の数 (デフォルト: 10000、--energy 指定時は上限なし)")
+    parser.add_argument("--energy", type=float,
+                        help="個数の代わりにスペクトルのエネルギーの割合 (例: 0.99) に達するまで係数を残す")
+    parser.add_argument("--hermitian", action="store_true",
+                        help="共役ペアの片方だけを保存する (再構成時に振幅を 2 倍)")
+    parser.add_argument("--format", choices=["json", "binary"], default="json",
+                        help="json: ブラウザ用 JSON / binary: 列形式のバイナリ (fft_reconstruct_.py 用)")
+    parser.add_argument("--output", help="出力ファイル (デフォルト: coeffs_color.json / coeffs_color.bin)")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="省メモリモード (チャンネルごと・ブロックごとに処理し、ピーク RSS を表示)")
+    parser.add_argument("--workdir", help="省メモリモードでスペクトルを memmap に置くディレクトリ")
+    parser.add_argument("--sequence", action="store_true",
+                        help="連番画像のフォルダ (直下の画像をファイル名の自然順に読む) または生の動画ストリームを、"
+                             "キーフレーム + フレームごとの差分で保存する")
+    parser.add_argument("--raw", type=parse_size, metavar="WxH",
+                        help="--sequence の入力を rgb24 の生フレームとして読む (\"-\" なら標準入力)")
+    parser.add_argument("--amp-tol", type=float, default=0.02,
+                        help="--sequence で振幅の相対変化がこれ以下の係数は送らない (デフォルト: 0.02)")
+    parser.add_argument("--phase-tol", type=float, default=0.05,
+                        help="--sequence で位相の変化 (ラジアン) がこれ以下の係数は送らない (デフォルト: 0.05)")
+    parser.add_argument("--keyframe-interval", type=int, default=0,
+                        help="--sequence で N フレームごとにキーフレームを入れる (デフォルト: 0 = 最初だけ)")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    IMAGE_PATH = './image.png'
-    N_COEFFS    = 10000  # お好みで増減
-    out = compute_fft_coeffs_color(IMAGE_PATH, num_coeffs=N_COEFFS)
+    args = parse_arguments()
+    N_COEFFS = args.num_coeffs  # お好みで増減
+    if N_COEFFS is None and args.energy is None:
+        N_COEFFS = 10000
+    if args.sequence:
+        if args.energy is not None or args.low_memory:
+            raise SystemExit("--sequence は --energy / --low-memory と同時には使えません")
+        output = args.output or 'coeffs_seq.bin'
+        if args.raw and args.image == '-':
+            src = contextlib.nullcontext(sys.stdin.buffer)
+        elif args.raw:
+            src = open(args.image, 'rb')
+        else:
+            src = contextlib.nullcontext()
+        with src as raw, open(output, 'wb') as fp:
+            frames = iter_frames_raw(raw, *args.raw) if args.raw else iter_frames_folder(args.image)
+            stats = encode_sequence(frames, fp, N_COEFFS, args.hermitian, args.amp_tol, args.phase_tol,
+                                    args.keyframe_interval)
+        ratio = stats['coeffs_sent'] / stats['coeffs_full'] if stats['coeffs_full'] else 0.0
+        print(f"{output} に保存しました: {stats['frames']} フレーム (キーフレーム {stats['keyframes']}), "
+              f"送信した係数 {stats['coeffs_sent']} / {stats['coeffs_full']} ({ratio * 100:.1f}%), "
+              f"{stats['bytes']} バイト")
+    else:
+        if args.low_memory:
+            if args.energy is not None:
+                raise SystemExit("--energy は --low-memory と同時には使えません")
+            spectra = compute_fft_spectra_lowmem(args.image, num_coeffs=N_COEFFS, workdir=args.workdir,
+                                                 hermitian=args.hermitian)
+        else:
+            spectra = compute_fft_spectra_color(args.image, num_coeffs=N_COEFFS,
+                                                hermitian=args.hermitian, energy=args.energy)
 
-    # JSON ファイルに保存
-    with open('coeffs_color.json', 'w') as fp:
-        json.dump(out, fp, indent=2)
+        if args.format == 'binary':
+            output = args.output or 'coeffs_color.bin'
+            save_coeffs_binary(spectra, output)
+        else:
+            # JSON ファイルに保存
+            output = args.output or 'coeffs_color.json'
+            with open(output, 'w') as fp:
+                json.dump(spectra_to_json(spectra), fp, indent=2)
 
-    print(f"coeffs_color.json に保存しました: {out['shape'][0]}×{out['shape'][1]}, 各チャンネル {N_COEFFS} 成分ずつ")
+        counts = '/'.join(str(len(spectra[ch]['amplitude'])) for ch in CHANNELS)
+        print(f"{output} に保存しました: {spectra['shape'][0]}×{spectra['shape'][1]}, 成分数 (r/g/b) {counts}")
+        if args.low_memory and peak_rss_mb() is not None:
+            print(f"ピーク RSS: {peak_rss_mb():.1f} MB")
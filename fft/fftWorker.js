@@ -1,64 +1,122 @@
 // fftWorker.js
 // Web Worker script for FFT-based image reconstruction
+//
+// Two kinds of input:
+//   - the whole coefficient set as JSON ({shape, r, g, b}), rendered once
+//   - a streamed set from coeff_server.py: a {type: 'header'} message followed
+//     by binary chunks (ArrayBuffer) in descending amplitude. Every chunk is
+//     added to running per-channel sums and a refined frame is posted back.
 
-self.onmessage = function(e) {
-    const data = e.data;
-    const [h, w] = data.shape;
-    const { r, g, b } = data;
-  
-    // Precompute coefficients
-    function prepareCoeffs(coeffs) {
-      const out = coeffs.map(c => ({
-        Ax: 2 * Math.PI * c.kx,
-        Ay: 2 * Math.PI * c.ky,
-        phase: c.phase,
-        amp: c.amplitude
-      }));
-      return out;
+const FRAME_CHUNK = 1;
+const CHUNK_HEADER_SIZE = 16;
+
+let shape = null;
+let hermitian = false;
+let acc = null;  // [Float32Array(h * w) for r, g, b]
+
+// In hermitian mode only one coefficient of each conjugate pair is stored;
+// every coefficient that is not its own conjugate counts twice.
+function weight(fx, fy) {
+  if (!hermitian) return 1;
+  const [h, w] = shape;
+  return ((2 * fx) % w === 0 && (2 * fy) % h === 0) ? 1 : 2;
+}
+
+function reset(newShape, newHermitian) {
+  shape = newShape;
+  hermitian = !!newHermitian;
+  const [h, w] = shape;
+  acc = [new Float32Array(h * w), new Float32Array(h * w), new Float32Array(h * w)];
+}
+
+// Add amp * cos(2π(fx x / w + fy y / h) + phase) to one channel.
+// cos(a + b) = cos a cos b - sin a sin b, so the x terms are computed once
+// per coefficient and each pixel costs two multiply-adds instead of a cos().
+function addCoeffs(target, fxs, fys, amps, phases) {
+  const [h, w] = shape;
+  const cx = new Float32Array(w);
+  const sx = new Float32Array(w);
+  for (let i = 0; i < amps.length; i++) {
+    const amp = amps[i] * weight(fxs[i], fys[i]);
+    const Ax = 2 * Math.PI * fxs[i] / w;
+    const Ay = 2 * Math.PI * fys[i] / h;
+    for (let x = 0; x < w; x++) {
+      cx[x] = Math.cos(Ax * x);
+      sx[x] = Math.sin(Ax * x);
     }
-    const coeffsR = prepareCoeffs(r);
-    const coeffsG = prepareCoeffs(g);
-    const coeffsB = prepareCoeffs(b);
-  
-    // Allocate pixel buffer (RGBA)
-    const pixelCount = w * h * 4;
-    const pixels = new Uint8ClampedArray(pixelCount);
-  
-    // Reconstruction loops
     for (let y = 0; y < h; y++) {
-      // Precompute y-dependent terms
-      const preR = coeffsR.map(c => c.Ay * y + c.phase);
-      const preG = coeffsG.map(c => c.Ay * y + c.phase);
-      const preB = coeffsB.map(c => c.Ay * y + c.phase);
-  
+      const t = Ay * y + phases[i];
+      const cy = amp * Math.cos(t);
+      const sy = amp * Math.sin(t);
+      const row = y * w;
       for (let x = 0; x < w; x++) {
-        let vr = 0, vg = 0, vb = 0;
-        // accumulate R
-        for (let i = 0; i < coeffsR.length; i++) {
-          vr += coeffsR[i].amp * Math.cos(coeffsR[i].Ax * x + preR[i]);
-        }
-        // accumulate G
-        for (let i = 0; i < coeffsG.length; i++) {
-          vg += coeffsG[i].amp * Math.cos(coeffsG[i].Ax * x + preG[i]);
-        }
-        // accumulate B
-        for (let i = 0; i < coeffsB.length; i++) {
-          vb += coeffsB[i].amp * Math.cos(coeffsB[i].Ax * x + preB[i]);
-        }
-        // Clamp to [0,255]
-        vr = vr < 0 ? 0 : vr > 255 ? 255 : vr;
-        vg = vg < 0 ? 0 : vg > 255 ? 255 : vg;
-        vb = vb < 0 ? 0 : vb > 255 ? 255 : vb;
-  
-        const idx = 4 * (x + y * w);
-        pixels[idx]   = vr;
-        pixels[idx+1] = vg;
-        pixels[idx+2] = vb;
-        pixels[idx+3] = 255;
+        target[row + x] += cy * cx[x] - sy * sx[x];
       }
     }
-  
-    // Transfer the pixel buffer back to main thread
-    self.postMessage(pixels.buffer, [pixels.buffer]);
-  };
-  
\ No newline at end of file
+  }
+}
+
+function addChunk(buffer) {
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== FRAME_CHUNK) return;
+  const counts = [view.getUint32(4, true), view.getUint32(8, true), view.getUint32(12, true)];
+  const total = counts[0] + counts[1] + counts[2];
+
+  const amps = new Float32Array(buffer, CHUNK_HEADER_SIZE, total);
+  const int16Offset = CHUNK_HEADER_SIZE + 4 * total;
+  const fxs = new Int16Array(buffer, int16Offset, total);
+  const fys = new Int16Array(buffer, int16Offset + 2 * total, total);
+  const qphase = new Uint16Array(buffer, int16Offset + 4 * total, total);
+  const phases = Float32Array.from(qphase, (q) => q * (2 * Math.PI / 65535) - Math.PI);
+
+  let start = 0;
+  for (let c = 0; c < 3; c++) {
+    const end = start + counts[c];
+    addCoeffs(acc[c], fxs.subarray(start, end), fys.subarray(start, end),
+              amps.subarray(start, end), phases.subarray(start, end));
+    start = end;
+  }
+}
+
+function addJSON(data) {
+  const [h, w] = shape;
+  ['r', 'g', 'b'].forEach((ch, c) => {
+    const coeffs = data[ch];
+    addCoeffs(acc[c],
+              coeffs.map(k => Math.round(k.kx * w)),
+              coeffs.map(k => Math.round(k.ky * h)),
+              coeffs.map(k => k.amplitude),
+              coeffs.map(k => k.phase));
+  });
+}
+
+function postFrame() {
+  const [h, w] = shape;
+  const pixels = new Uint8ClampedArray(w * h * 4);
+  const [r, g, b] = acc;
+  for (let i = 0; i < w * h; i++) {
+    // Uint8ClampedArray clamps to [0,255]
+    pixels[4 * i]     = r[i];
+    pixels[4 * i + 1] = g[i];
+    pixels[4 * i + 2] = b[i];
+    pixels[4 * i + 3] = 255;
+  }
+  // Transfer the pixel buffer back to main thread
+  self.postMessage(pixels.buffer, [pixels.buffer]);
+}
+
+self.onmessage = function(e) {
+  const data = e.data;
+  if (data instanceof ArrayBuffer) {
+    if (acc) {
+      addChunk(data);
+      postFrame();
+    }
+  } else if (data.type === 'header') {
+    reset(data.shape, data.hermitian);
+  } else {
+    reset(data.shape, data.hermitian);
+    addJSON(data);
+    postFrame();
+  }
+};
@@ -0,0 +1,228 @@
+"""
+fft.py のバッチ版。
+ディレクトリまたは glob で指定した画像をプロセスプールで並列に処理し、
+係数をキャッシュする (入力の相対パスごとに、画像内容の sha256 と num_coeffs が同じならスキップ)。
+出力ファイル名は入力の相対パスに拡張子を足したもの (a/b.png → a/b.png.bin)。
+読めない画像があってもバッチは止めず、失敗した画像は manifest に載せない (次回また処理する)。
+
+    python fft_batch.py ./images --num-coeffs 10000 --out-dir ./coeffs --workers 8
+    python fft_batch.py "./frames/*.png" --format json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from fft import compute_fft_spectra_color, compute_fft_spectra_lowmem, spectra_to_json
+from coeffs_format import save_coeffs_binary
+
+IMAGE_EXTS    = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+MANIFEST_NAME = 'manifest.json'
+STAGES        = ('hash', 'extract', 'write')
+
+
+def collect_inputs(source):
+    """ディレクトリ (再帰) または glob パターン → 画像パスのソート済みリスト"""
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+        ]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTS))
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def output_name(path, root, fmt):
+    """
+    入力のルートからの相対パスに拡張子を足して出力ファイル名にする (a/b.png → a/b.png.bin)。
+    元の拡張子を残すので、a.png と a.jpg が同じ出力になることはない
+    """
+    rel = os.path.relpath(path, root)
+    return rel + ('.json' if fmt == 'json' else '.bin')
+
+
+def source_key(path, root):
+    """manifest のキー: 入力のルートからの相対パス (区切りは / にそろえる)"""
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def hash_source(path, entry):
+    """
+    (sha256, size, mtime_ns, 秒数) を返す。
+    サイズと mtime が前回と同じなら前回のハッシュを使い回す
+    """
+    t0 = time.perf_counter()
+    st = os.stat(path)
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        sha = entry['sha256']
+    else:
+        sha = file_sha256(path)
+    return sha, st.st_size, st.st_mtime_ns, time.perf_counter() - t0
+
+
+def is_cached(entry, sha, num_coeffs, out_path):
+    """前回と同じ内容 (sha256)・同じ num_coeffs で、出力も残っていればキャッシュヒット"""
+    return (entry is not None and entry['sha256'] == sha and entry['num_coeffs'] == num_coeffs
+            and os.path.exists(out_path))
+
+
+def process_image(task):
+    """
+    ワーカープロセスで 1 画像を処理する (キャッシュの判定は親プロセスで済ませてある)。
+    戻り値: ステージごとの秒数
+    """
+    path, out_path, num_coeffs, fmt, low_memory = task
+    timings = {}
+
+    t0 = time.perf_counter()
+    if low_memory:
+        spectra = compute_fft_spectra_lowmem(path, num_coeffs)
+    else:
+        spectra = compute_fft_spectra_color(path, num_coeffs)
+    timings['extract'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    if fmt == 'json':
+        # json.dump はチャンク単位で書くので、文字列にしてから一度に書く方が速い
+        with open(out_path, 'w') as fp:
+            fp.write(json.dumps(spectra_to_json(spectra)))
+    else:
+        save_coeffs_binary(spectra, out_path)
+    timings['write'] = time.perf_counter() - t0
+
+    return timings
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp  = path + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(manifest, fp, indent=1)
+    os.replace(tmp, path)
+
+
+def run_batch(source, out_dir, num_coeffs=10000, fmt='binary', workers=None, low_memory=False):
+    """
+    source 以下の画像をすべて処理し、統計 dict を返す
+    (images, computed, cached, failed, seconds, images_per_sec, stages)
+
+    manifest は入力の相対パスをキーに、その内容の sha256・num_coeffs・出力ファイル名を記録する。
+    ハッシュとキャッシュの判定は親プロセスで行い、プールには計算が必要な画像だけを渡す
+    """
+    paths = collect_inputs(source)
+    if os.path.isdir(source):
+        root = source
+    else:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else '.'
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    stages   = dict.fromkeys(STAGES, 0.0)
+    t_start  = time.perf_counter()
+    workers  = workers or os.cpu_count() or 1
+
+    # ハッシュは I/O が主なのでスレッドで並べる (hashlib は GIL を解放する)
+    keys = [source_key(p, root) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = list(pool.map(hash_source, paths, [manifest.get(k) for k in keys]))
+
+    tasks  = {}  # キー → (タスク, 成功したら manifest に書くエントリ)
+    cached = 0
+    for path, key, (sha, size, mtime_ns, sec) in zip(paths, keys, hashes):
+        stages['hash'] += sec
+        name     = output_name(path, root, fmt)
+        out_path = os.path.join(out_dir, name)
+        entry    = {
+            'source': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': sha,
+            'num_coeffs': num_coeffs,
+            'output': name,
+        }
+        if is_cached(manifest.get(key), sha, num_coeffs, out_path):
+            cached += 1
+            manifest[key] = entry
+        else:
+            # 前回のエントリは今回の内容と合わないので、処理に成功するまで消しておく
+            manifest.pop(key, None)
+            tasks[key] = ((path, out_path, num_coeffs, fmt, low_memory), entry)
+
+    failed = 0
+    try:
+        if tasks:
+            # 1 枚ずつ結果を受け取り、読めない画像があっても残りは続ける
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(process_image, task): key for key, (task, _) in tasks.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        timings = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"{tasks[key][1]['source']} を処理できませんでした: {e}", file=sys.stderr)
+                        continue
+                    manifest[key] = tasks[key][1]
+                    for stage, sec in timings.items():
+                        stages[stage] += sec
+    finally:
+        # 途中で止まっても、それまでに処理した分はキャッシュに残す
+        save_manifest(out_dir, manifest)
+    elapsed = time.perf_counter() - t_start
+
+    return {
+        'images': len(paths),
+        'computed': len(tasks) - failed,
+        'cached': cached,
+        'failed': failed,
+        'seconds': elapsed,
+        'images_per_sec': len(paths) / elapsed if elapsed > 0 else 0.0,
+        'stages': stages,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="複数画像の FFT 係数を並列に抽出する")
+    parser.add_argument("source", help="画像ディレクトリまたは glob パターン")
+    parser.add_argument("--out-dir", default="./coeffs", help="出力ディレクトリ (デフォルト: ./coeffs)")
+    parser.add_argument("--num-coeffs", type=int, default=10000, help="各チャンネルの係数の数 (デフォルト: 10000)")
+    parser.add_argument("--format", choices=["json", "binary"], default="binary", help="出力形式 (デフォルト: binary)")
+    parser.add_argument("--workers", type=int, help="ワーカープロセス数 (デフォルト: CPU 数)")
+    parser.add_argument("--low-memory", action="store_true", help="fft.py の省メモリモードを使う")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    stats = run_batch(args.source, args.out_dir, args.num_coeffs, args.format, args.workers, args.low_memory)
+
+    print(f"{stats['images']} 枚 (計算 {stats['computed']} / キャッシュ {stats['cached']} / 失敗 {stats['failed']}) "
+          f"{stats['seconds']:.2f} 秒, {stats['images_per_sec']:.1f} 枚/秒")
+    for stage, sec in stats['stages'].items():
+        per = sec / stats['images'] if stats['images'] else 0.0
+        print(f"  {stage:8s} 合計 {sec:.3f} 秒 (1 枚あたり {per * 1000:.1f} ms)")
+    if stats['failed']:
+        sys.exit(1)
@@ -0,0 +1,251 @@
+"""
+FFT 係数の抽出・再構成パイプラインのベンチマーク。
+合成画像 (256² 〜 4096²) と係数の数 K (100 〜 100k) の組み合わせごとに、
+各ステージの実行時間、ピークメモリ (tracemalloc / RSS)、元画像に対する再構成の PSNR を計測し、
+JSON に保存する。前回の結果を渡すと比較し、閾値を超えて悪化した項目があれば終了コード 1 を返す。
+
+ステージ:
+    extract      fft.compute_fft_coeffs_color
+    serialize    json.dumps + ファイルへの書き込み
+    channel      fft_reconstruct_.reconstruct_channel (r, g, b の 3 回)
+    image        fft_reconstruct_.reconstruct_image_from_json (読み込み・再構成・PNG 保存)
+
+    python fft_bench.py --output before.json
+    python fft_bench.py --output after.json --compare before.json --threshold 0.2
+    python fft_bench.py --sizes 256,1024 --coeffs 100,10000   (一部だけ)
+
+組み合わせごとに新しいプロセスで実行するので、RSS のピークは前の組み合わせの影響を受けない
+(RSS は resource モジュールのある環境だけ。Windows では記録しない)。
+時間は tracemalloc を止めた状態で --repeat 回 (デフォルト 3) の最小値、メモリは別に 1 回トレースして測る。
+比較では、時間の差が --min-seconds 未満のものは計測誤差として無視する
+(1 回だけの計測では、同じコードでも小さいケースで 30〜40% ぶれることがある)。
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from fft import compute_fft_coeffs_color, peak_rss_mb
+from fft_reconstruct_ import reconstruct_channel, reconstruct_image_from_json
+
+DEFAULT_SIZES  = (256, 512, 1024, 2048, 4096)
+DEFAULT_COEFFS = (100, 1000, 10000, 100000)
+STAGES         = ('extract', 'serialize', 'channel', 'image')
+
+
+def synthetic_image(size, seed=0):
+    """
+    size × size の RGB 画像。なめらかなグラデーションと数個の正弦波にノイズを加え、
+    写真に近い「低周波が強く、高周波が弱い」スペクトルにする
+    """
+    rng  = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    img  = np.empty((size, size, 3), dtype=np.float32)
+    for c in range(3):
+        f = 96 + 64 * np.sin(2 * np.pi * (x * (c + 1) + y * 0.5))
+        for _ in range(6):
+            fx, fy = rng.integers(1, 48, size=2)
+            f += rng.uniform(4, 24) * np.cos(2 * np.pi * (fx * x + fy * y) + rng.uniform(0, 2 * np.pi))
+        f += rng.normal(0, 6, size=(size, size))
+        img[:, :, c] = f
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def measure(func, repeat):
+    """(最小の秒数, tracemalloc のピーク MB, 最後の戻り値)"""
+    best = float('inf')
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    del result
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / (1024 * 1024), result
+
+
+def run_case(task):
+    """子プロセスで 1 つの (size, K) を計測する"""
+    size, num_coeffs, repeat, workdir = task
+    src        = synthetic_image(size)
+    image_path = os.path.join(workdir, f'src_{size}.png')
+    json_path  = os.path.join(workdir, f'coeffs_{size}_{num_coeffs}.json')
+    out_path   = os.path.join(workdir, f'out_{size}_{num_coeffs}.png')
+    if not os.path.exists(image_path):
+        Image.fromarray(src).save(image_path)
+
+    stages = {}
+
+    def record(name, func):
+        sec, mem, result = measure(func, repeat)
+        stages[name] = {'seconds': sec, 'tracemalloc_mb': mem}
+        return result
+
+    coeffs = record('extract', lambda: compute_fft_coeffs_color(image_path, num_coeffs))
+
+    def serialize():
+        text = json.dumps(coeffs)
+        with open(json_path, 'w') as fp:
+            fp.write(text)
+        return len(text)
+    json_bytes = record('serialize', serialize)
+
+    shape = tuple(coeffs['shape'])
+    record('channel', lambda: [reconstruct_channel(coeffs[ch], shape) for ch in ('r', 'g', 'b')])
+
+    def image():
+        # reconstruct_image は保存先を print するので黙らせる
+        with contextlib.redirect_stdout(io.StringIO()):
+            reconstruct_image_from_json(json_path, out_path)
+    record('image', image)
+
+    recon = np.asarray(Image.open(out_path).convert('RGB'))
+    result = {
+        'size': size,
+        'num_coeffs': num_coeffs,
+        'kept_coeffs': len(coeffs['r']),
+        'json_mb': json_bytes / (1024 * 1024),
+        'psnr_db': psnr(src, recon),
+        'rss_peak_mb': peak_rss_mb(),
+        'stages': stages,
+    }
+    os.remove(json_path)
+    os.remove(out_path)
+    return result
+
+
+def case_key(case):
+    return f"{case['size']}x{case['num_coeffs']}"
+
+
+def compare(result, previous, threshold, psnr_threshold, min_seconds):
+    """
+    前回の結果と比較して悪化した項目のリストを返す。
+    時間とメモリは (今回 - 前回) / 前回 > threshold、PSNR は psnr_threshold dB 以上の低下を悪化とする。
+    min_seconds 未満の差の時間は計測誤差として扱う
+    """
+    before = {case_key(c): c for c in previous['cases']}
+    regressions = []
+    for case in result['cases']:
+        old = before.get(case_key(case))
+        if old is None:
+            continue
+        key = case_key(case)
+        for stage, now in case['stages'].items():
+            was = old['stages'].get(stage)
+            if not was:
+                continue
+            a, b = was['seconds'], now['seconds']
+            if b - a > min_seconds and a > 0 and (b - a) / a > threshold:
+                regressions.append(f"{key} {stage} 時間: {a:.3f} → {b:.3f} 秒 ({(b - a) / a * 100:+.1f}%)")
+            a, b = was['tracemalloc_mb'], now['tracemalloc_mb']
+            if b - a > 1.0 and a > 0 and (b - a) / a > threshold:
+                regressions.append(f"{key} {stage} メモリ: {a:.1f} → {b:.1f} MB ({(b - a) / a * 100:+.1f}%)")
+        # RSS を測れない環境 (Windows) の結果は None
+        a, b = old.get('rss_peak_mb'), case.get('rss_peak_mb')
+        if a is not None and b is not None and b - a > 1.0 and a > 0 and (b - a) / a > threshold:
+            regressions.append(f"{key} RSS: {a:.1f} → {b:.1f} MB ({(b - a) / a * 100:+.1f}%)")
+        if old['psnr_db'] - case['psnr_db'] > psnr_threshold:
+            regressions.append(f"{key} PSNR: {old['psnr_db']:.2f} → {case['psnr_db']:.2f} dB")
+    return regressions
+
+
+def print_result(result):
+    print(f"{'size':>6} {'K':>7} " + " ".join(f"{s:>10}" for s in STAGES) + f" {'RSS MB':>8} {'PSNR dB':>8}")
+    for case in result['cases']:
+        times = " ".join(f"{case['stages'][s]['seconds']:10.3f}" for s in STAGES)
+        rss = '-' if case['rss_peak_mb'] is None else f"{case['rss_peak_mb']:.1f}"
+        print(f"{case['size']:6d} {case['num_coeffs']:7d} {times} {rss:>8} {case['psnr_db']:8.2f}")
+
+
+def parse_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="FFT 係数の抽出・再構成パイプラインのベンチマーク")
+    parser.add_argument("--sizes", type=parse_list, default=list(DEFAULT_SIZES),
+                        help="画像の 1 辺 (カンマ区切り, デフォルト: 256,512,1024,2048,4096)")
+    parser.add_argument("--coeffs", type=parse_list, default=list(DEFAULT_COEFFS),
+                        help="各チャンネルの係数の数 K (カンマ区切り, デフォルト: 100,1000,10000,100000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="時間を測る回数 (最小値を使う, デフォルト: 3。1 回だけでは比較がノイズで失敗しやすい)")
+    parser.add_argument("--output", default="fft_bench_result.json", help="結果の JSON ファイル")
+    parser.add_argument("--compare", help="比較する前回の結果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="時間・メモリがこの割合を超えて増えたら悪化とする (デフォルト: 0.2 = 20%%)。"
+                             "時間は --min-seconds 以上の差があるときだけ判定する")
+    parser.add_argument("--psnr-threshold", type=float, default=0.1,
+                        help="PSNR がこの dB 以上下がったら悪化とする (デフォルト: 0.1)")
+    parser.add_argument("--min-seconds", type=float, default=0.01,
+                        help="これより小さい時間の差は無視する (デフォルト: 0.01)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    cases = []
+    # 組み合わせごとに新しいプロセス (RSS のピークを分けるため)。
+    # max_tasks_per_child は Python 3.11 以降にしかないので、毎回プールを作り直す
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for k in args.coeffs:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    case = pool.submit(run_case, (size, k, args.repeat, workdir)).result()
+                print(f"{size}² K={k}: " + ", ".join(f"{s} {case['stages'][s]['seconds']:.3f}s" for s in STAGES)
+                      + f", PSNR {case['psnr_db']:.2f} dB", flush=True)
+                cases.append(case)
+
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {'sizes': args.sizes, 'coeffs': args.coeffs, 'repeat': args.repeat},
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': sys.platform,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'cases': cases,
+    }
+    with open(args.output, 'w') as fp:
+        json.dump(result, fp, indent=2, ensure_ascii=False)
+    print_result(result)
+    print(f"結果を {args.output} に保存しました")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            previous = json.load(fp)
+        regressions = compare(result, previous, args.threshold, args.psnr_threshold, args.min_seconds)
+        if regressions:
+            print(f"{args.compare} より悪化した項目:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"{args.compare} からの悪化はありません")
+
+
+if __name__ == '__main__':
+    main()
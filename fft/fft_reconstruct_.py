@@ -1,57 +1,340 @@
+import argparse
 import json
+import sys
 import numpy as np
 from PIL import Image
 
-def reconstruct_channel(coeffs, shape):
+from coeffs_format import (CHANNELS, FRAME_KEY, iter_sequence_frames, load_coeffs_binary,
+                           read_sequence_header)
+
+def coeffs_to_indices(coeffs, shape):
+    """
+    Convert a list of {'kx', 'ky', 'amplitude', 'phase'} dicts into columns
+    with exact integer frequency indices (kx = fx / w, ky = fy / h).
+    """
+    h, w = shape
+    kx  = np.array([c['kx'] for c in coeffs], dtype=np.float64)
+    ky  = np.array([c['ky'] for c in coeffs], dtype=np.float64)
+    return {
+        'fx': np.rint(kx * w).astype(np.int32),
+        'fy': np.rint(ky * h).astype(np.int32),
+        'amplitude': np.array([c['amplitude'] for c in coeffs], dtype=np.float32),
+        'phase': np.array([c['phase'] for c in coeffs], dtype=np.float32),
+    }
+
+def hermitian_weights(fx, fy, shape):
+    """
+    1 for coefficients that are their own conjugate (DC, Nyquist),
+    2 for every other coefficient of a hermitian (deduplicated) set.
+    """
+    h, w = shape
+    self_conj = ((2 * np.asarray(fx)) % w == 0) & ((2 * np.asarray(fy)) % h == 0)
+    return np.where(self_conj, np.float32(1), np.float32(2))
+
+def resolve_hermitian(column, shape):
+    """
+    Turn a deduplicated column into one that can be reconstructed as is.
+    Since only the real part of the inverse FFT is kept, doubling the
+    amplitude is equivalent to adding the missing conjugate partner.
+    """
+    out = dict(column)
+    out['amplitude'] = np.asarray(column['amplitude'], dtype=np.float32) * hermitian_weights(
+        column['fx'], column['fy'], shape)
+    return out
+
+def to_uint8(f_real):
+    """
+    Stretch a real image to [0,255] and convert it to uint8.
+    Leading axes are treated as separate channels.
+    """
+    axes = (-2, -1)
+    f_real = f_real - f_real.min(axis=axes, keepdims=True)
+    f_real /= f_real.max(axis=axes, keepdims=True)
+    return (f_real * 255).astype(np.uint8)
+
+def scatter_spectrum(channels, shape):
+    """
+    Build the (C, h, w) unshifted spectrum for a list of coefficient columns
+    in a single vectorized write.
+    """
+    h, w = shape
+    F = np.zeros((len(channels), h, w), dtype=np.complex64)
+
+    counts = [len(c['amplitude']) for c in channels]
+    ci  = np.repeat(np.arange(len(channels)), counts)
+    fx  = np.concatenate([np.asarray(c['fx']) for c in channels])
+    fy  = np.concatenate([np.asarray(c['fy']) for c in channels])
+    amp = np.concatenate([np.asarray(c['amplitude'], dtype=np.float32) for c in channels])
+    ph  = np.concatenate([np.asarray(c['phase'], dtype=np.float32) for c in channels])
+
+    F[ci, fy % h, fx % w] = amp * np.float32(h * w) * np.exp(1j * ph)
+    return F
+
+def reconstruct_channels(channels, shape):
+    """
+    Reconstruct several channels at once: one scatter, one batched ifft2 over
+    the stacked channel axis. Returns a (C, h, w) uint8 array.
+    """
+    F = scatter_spectrum(channels, shape)
+    f = np.fft.ifft2(F, axes=(-2, -1))
+    return to_uint8(np.real(f))
+
+def reconstruct_channel(coeffs, shape, hermitian=False):
     """
     Reconstruct a single channel image from its FFT coefficients.
     coeffs: list of dicts with keys 'kx', 'ky', 'amplitude', 'phase'
     shape: (h, w)
+    hermitian: the list keeps only one coefficient of each conjugate pair
+    (fft.py --hermitian); the selection mode (count or energy) needs no flag.
     """
-    h, w = shape
-    # prepare empty Fourier domain array
-    F2 = np.zeros((h, w), dtype=np.complex64)
-
-    # Build the frequency coordinate grids
-    kx = np.fft.fftshift(np.fft.fftfreq(w))
-    ky = np.fft.fftshift(np.fft.fftfreq(h))
-    KX, KY = np.meshgrid(kx, ky)
-
-    # For each stored coefficient, find its nearest grid point and place the complex value
-    for c in coeffs:
-        # find nearest indices
-        ix = np.abs(kx - c['kx']).argmin()
-        iy = np.abs(ky - c['ky']).argmin()
-        # reconstruct complex coefficient
-        amp = c['amplitude'] * (h * w)
-        ph  = c['phase']
-        F2[iy, ix] = amp * np.exp(1j * ph)
-
-    # undo the fftshift
-    F = np.fft.ifftshift(F2)
-    # inverse 2D FFT
-    f = np.fft.ifft2(F)
-    # return real part, clipped to [0,255]
-    f_real = np.real(f)
-    f_real -= f_real.min()
-    f_real /= f_real.max()
-    return (f_real * 255).astype(np.uint8)
+    return reconstruct_channel_indexed(**coeffs_to_indices(coeffs, shape), shape=shape, hermitian=hermitian)
 
-def reconstruct_image_from_json(json_path, output_path='reconstructed.png'):
-    # load the JSON
-    with open(json_path, 'r') as fp:
-        data = json.load(fp)
+def reconstruct_channel_indexed(fx, fy, amplitude, phase, shape, hermitian=False):
+    """
+    Reconstruct a single channel from integer frequency indices
+    (as stored by coeffs_format), without any nearest-neighbour search.
+    """
+    column = {'fx': fx, 'fy': fy, 'amplitude': amplitude, 'phase': phase}
+    if hermitian:
+        column = resolve_hermitian(column, shape)
+    return reconstruct_channels([column], shape)[0]
 
+def load_binary_spectra(path):
+    """Memory-map a columnar coefficient file (coeffs_format); no parsing needed."""
+    data = load_coeffs_binary(path)
+    out  = {'shape': data['shape']}
+    for ch in CHANNELS:
+        out[ch] = resolve_hermitian(data[ch], data['shape']) if data['hermitian'] else data[ch]
+    return out
+
+def load_json_spectra(path):
+    """Load a JSON coefficient file (fft.py --format json), whatever its name."""
+    with open(path, 'r') as fp:
+        data = json.load(fp)
     h, w = data['shape']
-    # reconstruct each channel
-    r = reconstruct_channel(data['r'], (h, w))
-    g = reconstruct_channel(data['g'], (h, w))
-    b = reconstruct_channel(data['b'], (h, w))
+    out = {'shape': [h, w]}
+    for ch in CHANNELS:
+        out[ch] = coeffs_to_indices(data[ch], (h, w))
+        if data.get('hermitian'):
+            out[ch] = resolve_hermitian(out[ch], (h, w))
+    return out
+
+def load_spectra(path):
+    """
+    Load either file format into coefficient columns:
+    {'shape': [h, w], 'r': {'fx', 'fy', 'amplitude', 'phase'}, 'g': ..., 'b': ...}
+    The format is chosen by extension (.json, anything else is binary).
+    Deduplicated (hermitian) sets are resolved here, so callers never need
+    to care which mode the file was written in.
+    """
+    if path.endswith('.json'):
+        return load_json_spectra(path)
+    return load_binary_spectra(path)
+
+def reconstruct_image_from_spectra(spectra):
+    """Reconstruct an (h, w, 3) uint8 RGB image from coefficient columns."""
+    rgb = reconstruct_channels([spectra[ch] for ch in CHANNELS], spectra['shape'])
+    return np.moveaxis(rgb, 0, -1)
 
-    # stack and save
-    img = np.stack([r, g, b], axis=-1)
+def save_reconstruction(spectra, output_path):
+    img = reconstruct_image_from_spectra(spectra)
     Image.fromarray(img).save(output_path)
     print(f"Reconstructed image saved to {output_path}")
 
+def reconstruct_image(path, output_path='reconstructed.png'):
+    """Reconstruct from a .json or binary coefficient file and save the image."""
+    save_reconstruction(load_spectra(path), output_path)
+
+def thumbnail_shape(shape, max_side):
+    """(h, w) scaled so the longer side is max_side (never larger than the source)."""
+    h, w = shape
+    scale = min(1.0, max_side / max(h, w))
+    return max(1, round(h * scale)), max(1, round(w * scale))
+
+def reconstruct_pyramid(spectra, max_sides):
+    """
+    Reconstruct reduced-resolution previews by spectral cropping.
+
+    The kept coefficients are scattered once into a centred spectrum of the
+    largest requested size; every level is then a central crop of it (the
+    frequencies that fit the smaller grid) followed by a small batched ifft2.
+    Cost scales with the output sizes, not the source size.
+    Returns {max_side: (H, W, 3) uint8}.
+    """
+    h, w = spectra['shape']
+    shapes = {side: thumbnail_shape((h, w), side) for side in max_sides}
+    H0 = max(s[0] for s in shapes.values())
+    W0 = max(s[1] for s in shapes.values())
+
+    # only coefficients that fit the largest level are scattered at all
+    channels = []
+    for ch in CHANNELS:
+        c = spectra[ch]
+        fx, fy = np.asarray(c['fx']), np.asarray(c['fy'])
+        keep = ((W0 == w) | (np.abs(2 * fx) < W0)) & ((H0 == h) | (np.abs(2 * fy) < H0))
+        channels.append({k: np.asarray(c[k])[keep] for k in ('fx', 'fy', 'amplitude', 'phase')})
+    # scatter_spectrum puts frequency f at index f % n; shift to centre it
+    centred = np.fft.fftshift(scatter_spectrum(channels, (H0, W0)), axes=(-2, -1))
+
+    out = {}
+    for side, (H, W) in shapes.items():
+        y0 = H0 // 2 - H // 2
+        x0 = W0 // 2 - W // 2
+        F = centred[:, y0:y0 + H, x0:x0 + W].copy()
+        # drop the unpaired Nyquist row/column of reduced even sizes
+        if H < h and H % 2 == 0:
+            F[:, 0, :] = 0
+        if W < w and W % 2 == 0:
+            F[:, :, 0] = 0
+        f = np.fft.ifft2(np.fft.ifftshift(F, axes=(-2, -1)), axes=(-2, -1))
+        out[side] = np.moveaxis(to_uint8(np.real(f)), 0, -1)
+    return out
+
+def reconstruct_thumbnail(spectra, max_side):
+    """Single reduced-resolution reconstruction, see reconstruct_pyramid."""
+    return reconstruct_pyramid(spectra, [max_side])[max_side]
+
+def add_sparse_contribution(acc, channels, start, stop, shape):
+    """
+    Add coefficients [start, stop) of each channel to the real image
+    accumulator acc (C, h, w) in place.
+
+    A handful of new coefficients is evaluated directly as separable outer
+    products (h x n) @ (n x w); larger batches go through one batched ifft2
+    of the delta spectrum. Either way only the new terms are touched.
+    """
+    h, w = shape
+    delta = [{k: np.asarray(c[k])[start:stop] for k in ('fx', 'fy', 'amplitude', 'phase')}
+             for c in channels]
+    n_new = max(len(c['amplitude']) for c in delta)
+    if n_new == 0:
+        return acc
+
+    if n_new <= int(np.log2(h * w)):
+        y = np.arange(h)
+        x = np.arange(w)
+        for i, c in enumerate(delta):
+            if len(c['amplitude']) == 0:
+                continue
+            coef = c['amplitude'].astype(np.float32) * np.exp(1j * c['phase'].astype(np.float32))
+            Ey = np.exp(2j * np.pi * np.outer(y, c['fy']) / h)
+            Ex = np.exp(2j * np.pi * np.outer(c['fx'], x) / w)
+            acc[i] += np.real(Ey @ (coef[:, None] * Ex))
+    else:
+        F = scatter_spectrum(delta, shape)
+        acc += np.real(np.fft.ifft2(F, axes=(-2, -1)))
+    return acc
+
+def progressive_reconstruct(spectra, counts, frame_pattern=None):
+    """
+    Yield (count, image) for each requested coefficient count, in ascending
+    order. Each step only adds the contributions of the coefficients kept
+    since the previous step (coefficients are stored in descending amplitude).
+    If frame_pattern is given (e.g. 'frame_{count:06d}.png'), every frame is
+    also written out as soon as it is ready.
+    """
+    h, w = spectra['shape']
+    channels = [spectra[ch] for ch in CHANNELS]
+    acc  = np.zeros((len(channels), h, w), dtype=np.float64)
+    done = 0
+    for count in sorted(counts):
+        add_sparse_contribution(acc, channels, done, count, (h, w))
+        done = max(done, count)
+        img = np.moveaxis(to_uint8(acc), 0, -1)
+        if frame_pattern:
+            path = frame_pattern.format(count=count)
+            Image.fromarray(img).save(path)
+            print(f"Frame with {count} coefficients saved to {path}")
+        yield count, img
+
+class SequenceDecoder:
+    """
+    Stateful decoder for fft.py --sequence streams.
+
+    Keeps the current (C, h, w) spectrum and writes each frame's changes
+    into it in place: a keyframe clears it first, a delta only touches the
+    coefficients it carries (amplitude 0 clears one). A frame then costs
+    one small scatter plus one batched ifft2, however long the sequence is.
+    """
+
+    def __init__(self, shape, hermitian=False):
+        h, w = shape
+        self.shape     = (h, w)
+        self.hermitian = hermitian
+        self.F         = np.zeros((len(CHANNELS), h, w), dtype=np.complex64)
+        self.index     = None
+
+    def apply(self, kind, index, channels):
+        """Apply one frame record (as yielded by coeffs_format.iter_sequence_frames)."""
+        h, w = self.shape
+        if kind == FRAME_KEY:
+            self.F[:] = 0
+        for c, column in enumerate(channels):
+            if self.hermitian:
+                column = resolve_hermitian(column, self.shape)
+            fx = np.asarray(column['fx'])
+            fy = np.asarray(column['fy'])
+            self.F[c, fy % h, fx % w] = (np.asarray(column['amplitude'], dtype=np.float32) * np.float32(h * w)
+                                         * np.exp(1j * np.asarray(column['phase'], dtype=np.float32)))
+        self.index = index
+
+    def image(self):
+        """The current frame as an (h, w, 3) uint8 RGB image."""
+        f = np.fft.ifft2(self.F, axes=(-2, -1))
+        return np.moveaxis(to_uint8(np.real(f)), 0, -1)
+
+def decode_sequence(fp):
+    """
+    Yield (index, image) for every frame of a sequence stream, decoding
+    incrementally as records are read (fp may be a pipe).
+    """
+    header  = read_sequence_header(fp)
+    decoder = SequenceDecoder(header['shape'], header['hermitian'])
+    for kind, index, channels in iter_sequence_frames(fp):
+        decoder.apply(kind, index, channels)
+        yield index, decoder.image()
+
+def reconstruct_image_from_json(json_path, output_path='reconstructed.png'):
+    save_reconstruction(load_json_spectra(json_path), output_path)
+
+def reconstruct_image_from_binary(bin_path, output_path='reconstructed.png'):
+    save_reconstruction(load_binary_spectra(bin_path), output_path)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Reconstruct an image from FFT coefficients")
+    parser.add_argument("path", nargs="?", default="coeffs_color.json",
+                        help="coefficient file (.json or binary, default: coeffs_color.json)")
+    parser.add_argument("--output", default="image_reconstructed.png", help="output image")
+    parser.add_argument("--progressive", type=lambda s: [int(v) for v in s.split(",")],
+                        help="comma separated coefficient counts, e.g. 100,1000,10000")
+    parser.add_argument("--frames", default="frame_{count:06d}.png",
+                        help="file name pattern for --progressive frames")
+    parser.add_argument("--pyramid", type=lambda s: [int(v) for v in s.split(",")],
+                        help="comma separated preview sizes (longer side), e.g. 1024,512,256")
+    parser.add_argument("--pyramid-output", default="preview_{size}.png",
+                        help="file name pattern for --pyramid images")
+    parser.add_argument("--sequence", action="store_true",
+                        help="path is a sequence written by fft.py --sequence (\"-\" reads stdin)")
+    parser.add_argument("--sequence-output", default="sequence_{index:06d}.png",
+                        help="file name pattern for --sequence frames")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    reconstruct_image_from_json('coeffs_color.json', 'image_reconstructed.png')
+    args = parse_arguments()
+    if args.sequence:
+        fp = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        with fp:
+            for index, img in decode_sequence(fp):
+                path = args.sequence_output.format(index=index)
+                Image.fromarray(img).save(path)
+                print(f"Frame {index} saved to {path}")
+    elif args.pyramid:
+        for size, img in reconstruct_pyramid(load_spectra(args.path), args.pyramid).items():
+            path = args.pyramid_output.format(size=size)
+            Image.fromarray(img).save(path)
+            print(f"Preview {img.shape[1]}x{img.shape[0]} saved to {path}")
+    elif args.progressive:
+        for _ in progressive_reconstruct(load_spectra(args.path), args.progressive, args.frames):
+            pass
+    else:
+        reconstruct_image(args.path, args.output)
@@ -1,21 +1,21 @@
 // sketch.js
 let data, worker;
 
+// index.html?image=photo.png&k=20000 なら coeff_server.py から係数を段階的に受け取る
+// (server=ws://host:port で接続先を変更。image がなければ従来どおり JSON を一括で読む)
+const query = new URLSearchParams(location.search);
+const streamImage = query.get('image');
+
 function preload(){
-  data = loadJSON('coeffs_color.json');
+  if (!streamImage) {
+    data = loadJSON('coeffs_color.json');
+  }
 }
 
 function setup(){
-  const [h, w] = data.shape;
-  createCanvas(w, h);
-  pixelDensity(1);
-
   // WebWorker の生成
   worker = new Worker('fftWorker.js');
 
-  // JSON データを渡す
-  worker.postMessage(data);
-
   // Worker からピクセルバッファが返ってきたら描画
   worker.onmessage = (e) => {
     const pixelsBuf = e.data; // ArrayBuffer
@@ -26,9 +26,55 @@ function setup(){
     updatePixels();
   };
 
+  if (streamImage) {
+    createCanvas(1, 1);
+    pixelDensity(1);
+    streamCoeffs();
+  } else {
+    const [h, w] = data.shape;
+    createCanvas(w, h);
+    pixelDensity(1);
+
+    // JSON データを渡す
+    worker.postMessage(data);
+  }
+
   noLoop();
 }
 
+function streamCoeffs(){
+  const url = query.get('server') || `ws://${location.hostname || 'localhost'}:8765`;
+  const ws = new WebSocket(url);
+  ws.binaryType = 'arraybuffer';
+
+  ws.onopen = () => {
+    ws.send(JSON.stringify({
+      type: 'coeffs',
+      image: streamImage,
+      numCoeffs: query.has('k') ? Number(query.get('k')) : undefined,
+    }));
+  };
+
+  ws.onmessage = (e) => {
+    // チャンクはそのまま Worker に渡す (コピーしない)
+    if (e.data instanceof ArrayBuffer) {
+      worker.postMessage(e.data, [e.data]);
+      return;
+    }
+    const msg = JSON.parse(e.data);
+    if (msg.type === 'header') {
+      const [h, w] = msg.shape;
+      resizeCanvas(w, h);
+      worker.postMessage(msg);
+    } else if (msg.type === 'done') {
+      ws.close();
+    } else if (msg.type === 'error') {
+      console.error('coeff_server:', msg.message);
+      ws.close();
+    }
+  };
+}
+
 function draw(){
   // Worker 処理後に描かれるので空
 }
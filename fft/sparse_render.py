@@ -0,0 +1,136 @@
+"""
+Server-side reference renderer for the sparse Fourier series drawn by
+fftWorker.js:
+
+    v(x, y) = sum_k amplitude_k * cos(2*pi*(kx_k * x + ky_k * y) + phase_k)
+
+clamped to [0, 255] exactly like the browser worker (no min/max stretch).
+The series is continuous, so it can be evaluated at any output size; the
+source grid is resampled so the output covers the same extent.
+
+The sum factorises into (H x K) @ (K x W) complex matrix products, which
+are split into row blocks and run on a thread pool (numpy releases the GIL
+inside matmul).
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from coeffs_format import CHANNELS
+from fft_reconstruct_ import load_spectra, resolve_hermitian, scatter_spectrum
+
+
+def render_channel(column, shape, out_shape, block_rows=64, pool=None):
+    """Evaluate one channel of the series on an out_shape grid -> float32 (H, W)."""
+    h, w = shape
+    H, W = out_shape
+    fx   = np.asarray(column['fx'], dtype=np.float64)
+    fy   = np.asarray(column['fy'], dtype=np.float64)
+    coef = (np.asarray(column['amplitude'], dtype=np.float32)
+            * np.exp(1j * np.asarray(column['phase'], dtype=np.float32))).astype(np.complex64)
+
+    # sample positions in source pixel units
+    xs = np.arange(W) * (w / W)
+    ys = np.arange(H) * (h / H)
+    Ex = (coef[:, None] * np.exp(2j * np.pi * np.outer(fx / w, xs))).astype(np.complex64)
+
+    out = np.empty((H, W), dtype=np.float32)
+
+    def run(r0):
+        Ey = np.exp(2j * np.pi * np.outer(ys[r0:r0 + block_rows], fy / h)).astype(np.complex64)
+        out[r0:r0 + block_rows] = np.real(Ey @ Ex)
+
+    starts = range(0, H, block_rows)
+    if pool is None:
+        for r0 in starts:
+            run(r0)
+    else:
+        list(pool.map(run, starts))
+    return out
+
+
+def render_sparse(spectra, out_shape=None, block_rows=64, workers=None):
+    """
+    Render an (H, W, 3) uint8 image of the sparse series.
+    out_shape defaults to the source shape.
+    """
+    shape = tuple(spectra['shape'])
+    out_shape = tuple(out_shape or shape)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        channels = []
+        for ch in CHANNELS:
+            column = spectra[ch]
+            if spectra.get('hermitian'):
+                column = resolve_hermitian(column, shape)
+            channels.append(render_channel(column, shape, out_shape, block_rows, pool))
+    return np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+
+
+def render_dense(spectra):
+    """Same clamped series on the source grid, through the dense ifft2 path."""
+    chans = [resolve_hermitian(spectra[ch], spectra['shape']) if spectra.get('hermitian') else spectra[ch]
+             for ch in CHANNELS]
+    F = scatter_spectrum(chans, spectra['shape'])
+    f = np.real(np.fft.ifft2(F, axes=(-2, -1)))
+    return np.clip(np.moveaxis(f, 0, -1), 0, 255).astype(np.uint8)
+
+
+def benchmark(spectra, sizes, repeat=3, workers=None):
+    """
+    Time the sparse renderer at each output size against the dense ifft2 path
+    on the source grid, and check the two agree at the source size.
+    Returns a list of result dicts.
+    """
+    def best_of(fn):
+        best, result = float('inf'), None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - t0)
+        return best, result
+
+    dense_t, dense = best_of(lambda: render_dense(spectra))
+    results = [{'renderer': 'dense', 'size': list(spectra['shape']), 'seconds': dense_t}]
+    for size in sizes:
+        t, img = best_of(lambda: render_sparse(spectra, size, workers=workers))
+        row = {'renderer': 'sparse', 'size': list(size), 'seconds': t}
+        if tuple(size) == tuple(spectra['shape']):
+            row['max_abs_diff_vs_dense'] = int(np.abs(img.astype(np.int16) - dense).max())
+        results.append(row)
+    return results
+
+
+def parse_size(text):
+    """'512x384' -> (384, 512) as (h, w)"""
+    w, h = (int(v) for v in text.lower().split('x'))
+    return h, w
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Render the sparse Fourier series at any resolution")
+    parser.add_argument("path", nargs="?", default="coeffs_color.json", help="coefficient file (.json or binary)")
+    parser.add_argument("--size", type=parse_size, help="output size WxH (default: source size)")
+    parser.add_argument("--output", default="image_rendered.png", help="output image")
+    parser.add_argument("--workers", type=int, help="threads for row blocks (default: CPU count)")
+    parser.add_argument("--benchmark", nargs="*", type=parse_size, metavar="WxH",
+                        help="compare against the dense ifft2 path at these sizes (default: source size)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    spectra = load_spectra(args.path)
+
+    if args.benchmark is not None:
+        sizes = args.benchmark or [tuple(spectra['shape'])]
+        for row in benchmark(spectra, sizes, workers=args.workers):
+            h, w = row['size']
+            extra = f", max diff {row['max_abs_diff_vs_dense']}" if 'max_abs_diff_vs_dense' in row else ''
+            print(f"{row['renderer']:6s} {w}x{h}: {row['seconds'] * 1000:.1f} ms{extra}")
+    else:
+        img = render_sparse(spectra, args.size, workers=args.workers)
+        Image.fromarray(img).save(args.output)
+        print(f"Rendered image saved to {args.output}")
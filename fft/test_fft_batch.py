@@ -0,0 +1,27 @@
+"""
+fft_batch.py のテスト (python -m pytest test_fft_batch.py)
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+from fft_batch import MANIFEST_NAME, load_manifest, run_batch
+
+
+def test_corrupt_input_does_not_abort_batch(tmp_path):
+    src, out = tmp_path / 'images', tmp_path / 'coeffs'
+    src.mkdir()
+    rng = np.random.default_rng(0)
+    for name in ('a.png', 'b.png'):
+        Image.fromarray(rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)).save(src / name)
+    (src / 'bad.png').write_bytes(b'not a png')
+
+    stats = run_batch(str(src), str(out), num_coeffs=20, workers=2)
+    assert (stats['computed'], stats['cached'], stats['failed']) == (2, 0, 1)
+    assert os.path.exists(out / MANIFEST_NAME)
+    assert sorted(load_manifest(str(out))) == ['a.png', 'b.png']
+
+    # 2 回目は正常な画像だけキャッシュから使い、壊れた画像はもう一度試す
+    stats = run_batch(str(src), str(out), num_coeffs=20, workers=2)
+    assert (stats['computed'], stats['cached'], stats['failed']) == (0, 2, 1)